@@ -34,7 +34,6 @@ pip install scikit-learn
 pip install scikit-video
 pip install imgstore==0.2.9
 pip install qimage2ndarray==1.8
-pip install jsmin
 pip install seaborn
 pip install pykalman==0.9.5
 pip install segmentation-models==1.0.1
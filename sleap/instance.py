@@ -862,9 +862,9 @@ class Instance:
     def bounding_box(self) -> np.ndarray:
         """Return bounding box containing all points in `[y1, x1, y2, x2]` format."""
         points = self.points_array
-        bbox = np.concatenate(
-            [np.nanmin(points, axis=0)[::-1], np.nanmax(points, axis=0)[::-1]]
-        )
+        bbox = np.empty(4, dtype=points.dtype)
+        bbox[:2] = np.nanmin(points, axis=0)[::-1]
+        bbox[2:] = np.nanmax(points, axis=0)[::-1]
         return bbox
 
     @property
@@ -876,7 +876,9 @@ class Instance:
     @property
     def n_visible_points(self) -> int:
         """Return the number of visible points in this instance."""
-        return sum(~np.isnan(self.points_array[:, 0]))
+        # Count from the point array directly rather than building `points_array`.
+        self._fix_array()
+        return int(np.count_nonzero(self._points.visible & ~np.isnan(self._points.x)))
 
     def __len__(self) -> int:
         """Return the number of visible points in this instance."""
@@ -27,6 +27,7 @@ from sleap.instance import (
     make_instance_cattr,
 )
 from sleap.io.legacy import load_labels_json_old
+from sleap.io.video import cache_path_lookups
 from sleap.skeleton import Node, Skeleton
 from sleap.util import json_loads, json_dumps, weak_filename_match
 
@@ -379,7 +380,8 @@ class LabelsJsonAdaptor(Adaptor):
         skeletons = Skeleton.make_cattr(idx_to_node).structure(
             dicts["skeletons"], List[Skeleton]
         )
-        videos = Video.cattr().structure(dicts["videos"], List[Video])
+        with cache_path_lookups():
+            videos = Video.cattr().structure(dicts["videos"], List[Video])
 
         try:
             # First try unstructuring tuple (newer format)
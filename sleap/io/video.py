@@ -1,7 +1,10 @@
 """ Video reading and writing interfaces for different formats. """
 
+import contextlib
 import os
 import shutil
+import time
+import zlib
 
 import h5py as h5
 import cv2
@@ -9,14 +12,331 @@ import imgstore
 import numpy as np
 import attr
 import cattr
+import itertools
 import logging
 import multiprocessing
+import queue
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    Text,
+)
+
+from sleap.util import json_loads, json_dumps, usable_cpu_count
+
+try:
+    # Registers additional HDF5 compression filters (e.g., Blosc) with h5py.
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 
-from typing import Iterable, List, Optional, Tuple, Union, Text
+logger = logging.getLogger(__name__)
 
-from sleap.util import json_loads, json_dumps
+# Object that signals the end of a queue.
+_sentinel = object()
 
-logger = logging.getLogger(__name__)
+# Extra directories that Video.fixup_path searches for videos which cannot be found
+# at their stored path. Defaults to the SLEAP_VIDEO_SEARCH_DIRS environment variable,
+# a list of directories separated by os.pathsep.
+VIDEO_SEARCH_DIRS = [
+    d for d in os.environ.get("SLEAP_VIDEO_SEARCH_DIRS", "").split(os.pathsep) if d
+]
+
+# Absolute paths that have been found to exist by _path_exists while lookups are
+# cached with cache_path_lookups. This is None when lookups are not cached.
+_EXISTING_PATHS: Optional[Set[str]] = None
+
+
+@contextlib.contextmanager
+def cache_path_lookups():
+    """Cache the paths that `Video.fixup_path` finds to exist within this context.
+
+    This is meant to be used while loading many videos at once (e.g., when
+    deserializing a :class:`Labels` dataset). The cache is discarded when the context
+    exits, so files that are moved or deleted later are not found at their old path.
+    """
+    global _EXISTING_PATHS
+    if _EXISTING_PATHS is not None:
+        # Already caching in an enclosing context.
+        yield
+        return
+
+    _EXISTING_PATHS = set()
+    try:
+        yield
+    finally:
+        _EXISTING_PATHS = None
+
+
+def _path_exists(path: str) -> bool:
+    """Return whether a path exists, caching positive results if enabled.
+
+    Only paths that exist are cached, so files that appear later are still found.
+    Relative paths are cached by their absolute path since the result depends on
+    the current working directory.
+    """
+    path = os.path.abspath(path)
+    existing_paths = _EXISTING_PATHS
+    if existing_paths is not None and path in existing_paths:
+        return True
+    if not os.path.exists(path):
+        return False
+    if existing_paths is not None:
+        existing_paths.add(path)
+    return True
+
+
+def _prefetch(items: Iterable[Any], prefetch: int = 8) -> Iterator[Any]:
+    """Iterate over items in a background thread, yielding them in order.
+
+    Items are passed through a bounded queue, so at most `prefetch` items are held
+    in memory while the consumer catches up. This lets I/O bound work done while
+    iterating (e.g., decoding frames, which releases the GIL) overlap with whatever
+    the consumer does with the items.
+
+    Args:
+        items: Iterable to consume in the background thread.
+        prefetch: Maximum number of items to fetch ahead of the consumer.
+
+    Yields:
+        Each item in `items`.
+
+    Raises:
+        Any exception raised while iterating is re-raised in the consuming thread.
+    """
+    out_q = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(x) -> bool:
+        # Time out periodically so we can stop if the consumer has gone away.
+        while not stop.is_set():
+            try:
+                out_q.put(x, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except Exception as ex:
+            put(ex)
+        put(_sentinel)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            result = out_q.get()
+            if result is _sentinel:
+                break
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _prefetch_map(
+    fn: Callable[[Any], Any], items: Iterable[Any], prefetch: int = 8
+) -> Iterator[Any]:
+    """Apply a function to items in a background thread, yielding results in order.
+
+    See `_prefetch`. Calls can be chained to build a multi-stage pipeline.
+
+    Args:
+        fn: Function to apply to each item.
+        items: Iterable of items to apply the function to.
+        prefetch: Maximum number of results to compute ahead of the consumer.
+
+    Yields:
+        `fn(item)` for each item in `items`.
+
+    Raises:
+        Any exception raised by `fn` is re-raised in the consuming thread.
+    """
+    return _prefetch(map(fn, items), prefetch=prefetch)
+
+
+def _threaded_map(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    n_workers: int,
+    max_pending: Optional[int] = None,
+) -> Iterator[Any]:
+    """Apply a function to items using a pool of threads, yielding results in order.
+
+    Only `max_pending` items are submitted at a time, and a new item is submitted
+    each time a result is taken, so that only a bounded number of items and results
+    are held in memory. This is useful when the function mostly runs outside of the
+    GIL (e.g., decoding images with OpenCV).
+
+    Args:
+        fn: Function to apply to each item.
+        items: Iterable of items to apply the function to.
+        n_workers: Number of threads to use.
+        max_pending: Maximum number of items that are submitted but whose results
+            have not been yielded yet. Defaults to twice `n_workers`.
+
+    Yields:
+        `fn(item)` for each item in `items`.
+    """
+    if max_pending is None:
+        max_pending = n_workers * 2
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        pending = deque(
+            executor.submit(fn, item) for item in itertools.islice(items, max_pending)
+        )
+        while pending:
+            result = pending.popleft().result()
+
+            # Keep the workers busy while the result is being consumed.
+            for item in itertools.islice(items, 1):
+                pending.append(executor.submit(fn, item))
+
+            yield result
+
+
+# Target size in bytes of the chunks that Video.to_hdf5 stores raw frames in. Chunks
+# hold as many whole frames as fit so that batches of consecutive frames can be read
+# with few filter calls. This matches the default size of the h5py chunk cache, so a
+# chunk only needs to be decompressed once when reading its frames one at a time.
+HDF5_CHUNK_BYTES = 1024 * 1024
+
+
+def _iter_chunk_blocks(
+    frames: Iterable[np.ndarray], n_frames: int
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Group frames into blocks that each fill one HDF5 chunk.
+
+    The number of frames per block is chosen from the size of the first frame so
+    that blocks are about `HDF5_CHUNK_BYTES`. A new array is allocated for each
+    block, so blocks can be consumed concurrently.
+
+    Args:
+        frames: Iterable of frames with the same shape and dtype.
+        n_frames: Total number of frames in `frames`.
+
+    Yields:
+        Tuples of `(start, n, block)` where `start` is the index of the first frame
+        in the block and `n` is the number of frames in it. The last block is padded
+        with zeros to the full chunk size.
+    """
+    chunk_n, block = None, None
+    for i, frame in enumerate(frames):
+        if chunk_n is None:
+            chunk_n = min(n_frames, max(1, HDF5_CHUNK_BYTES // max(1, frame.nbytes)))
+
+        j = i % chunk_n
+        if j == 0:
+            block = np.zeros((chunk_n,) + frame.shape, dtype=frame.dtype)
+        block[j] = frame
+
+        if j == chunk_n - 1 or i == n_frames - 1:
+            yield i - j, j + 1, block
+
+
+def _encode_chunk(block: np.ndarray, compression: Optional[str], level: int) -> bytes:
+    """Encode a chunk the same way as the HDF5 filters set by to_hdf5 would.
+
+    This supports chunks that are uncompressed, or gzip compressed with the byte
+    shuffle filter for multi-byte dtypes, so they can be written directly with
+    `write_direct_chunk`.
+
+    Args:
+        block: Array with the shape of a full chunk.
+        compression: None or "gzip".
+        level: gzip compression level.
+
+    Returns:
+        The encoded bytes for the chunk.
+    """
+    if compression is None:
+        return block.tobytes()
+
+    itemsize = block.dtype.itemsize
+    if itemsize > 1:
+        # The shuffle filter stores the first byte of every element, then the second
+        # byte of every element, and so on.
+        data = np.ascontiguousarray(block).view(np.uint8).reshape(-1, itemsize)
+        data = data.T.tobytes()
+    else:
+        data = block.tobytes()
+    return zlib.compress(data, level)
+
+
+# Cache of read-only blank frames by shape, see _zero_frame.
+_ZERO_FRAMES = dict()
+
+
+def _zero_frame(shape: Tuple[int, ...]) -> np.ndarray:
+    """Return a read-only blank uint8 frame of the given shape.
+
+    Frames are cached by shape so repeated calls don't allocate new arrays.
+    """
+    shape = tuple(shape)
+    if shape not in _ZERO_FRAMES:
+        frame = np.zeros(shape, dtype=np.uint8)
+        frame.setflags(write=False)
+        _ZERO_FRAMES[shape] = frame
+    return _ZERO_FRAMES[shape]
+
+
+def _hdf5_compression_kwargs(
+    compression: Optional[str], compression_opts=None, shuffle: bool = False
+) -> dict:
+    """Return keyword arguments for `h5py.Group.create_dataset` compression.
+
+    Args:
+        compression: Name of the compression filter. In addition to the filters
+            natively supported by h5py ("gzip", "lzf", "szip"), "blosc" is
+            supported if the `hdf5plugin` package is installed, in which case the
+            fast LZ4 compressor with byte shuffling is used. Falls back to "lzf"
+            if `hdf5plugin` is not available. If `None`, no compression is used.
+        compression_opts: Options for the compression filter. For "blosc", this
+            is the compression level (defaults to 5).
+        shuffle: Whether to apply the HDF5 byte shuffle filter before compression.
+            This only helps for data types with more than one byte per element.
+            Blosc always does its own shuffling.
+
+    Returns:
+        A dictionary of keyword arguments for `create_dataset`.
+    """
+    if compression == "blosc" and hdf5plugin is None:
+        logger.warning("hdf5plugin not installed, using lzf compression.")
+        compression, compression_opts = "lzf", None
+
+    if compression == "blosc":
+        clevel = 5 if compression_opts is None else compression_opts
+        return dict(
+            hdf5plugin.Blosc(
+                cname="lz4", clevel=clevel, shuffle=hdf5plugin.Blosc.SHUFFLE
+            )
+        )
+
+    if compression is None:
+        return dict()
+
+    return dict(
+        compression=compression, compression_opts=compression_opts, shuffle=shuffle
+    )
 
 
 @attr.s(auto_attribs=True, eq=False, order=False)
@@ -43,6 +363,54 @@ class DummyVideo:
         return np.zeros((self.height, self.width, self.channels))
 
 
+# Read-only HDF5 file handles shared between HDF5Video backends, keyed by the real
+# path to the file. Values are [h5.File, reference count].
+_HDF5_FILE_HANDLES = dict()
+
+
+def _acquire_hdf5_file(filename: str) -> Tuple[h5.File, str]:
+    """Open (or reuse an open) read-only HDF5 file handle.
+
+    Args:
+        filename: Path to the HDF5 file.
+
+    Returns:
+        Tuple of (h5.File, key). The key must be passed to `_release_hdf5_file`
+        when the handle is no longer needed.
+
+    Raises:
+        FileNotFoundError: If the file could not be opened.
+    """
+    key = os.path.realpath(filename)
+    entry = _HDF5_FILE_HANDLES.get(key, None)
+
+    # Reopen if the file was closed from outside.
+    if entry is None or not entry[0]:
+        try:
+            entry = [h5.File(filename, "r"), 0]
+        except OSError as ex:
+            raise FileNotFoundError(f"Could not find HDF5 file {filename}") from ex
+        _HDF5_FILE_HANDLES[key] = entry
+
+    entry[1] += 1
+    return entry[0], key
+
+
+def _release_hdf5_file(key: str):
+    """Release a handle from `_acquire_hdf5_file`, closing the file if unused."""
+    entry = _HDF5_FILE_HANDLES.get(key, None)
+    if entry is None:
+        return
+
+    entry[1] -= 1
+    if entry[1] <= 0:
+        del _HDF5_FILE_HANDLES[key]
+        try:
+            entry[0].close()
+        except:
+            pass
+
+
 @attr.s(auto_attribs=True, eq=False, order=False)
 class HDF5Video:
     """
@@ -68,6 +436,8 @@ class HDF5Video:
     input_format: str = attr.ib(default="channels_last")
     convert_range: bool = attr.ib(default=True)
 
+    _file_key_ = None
+
     def __attrs_post_init__(self):
         """Called by attrs after __init__()."""
 
@@ -84,6 +454,11 @@ class HDF5Video:
             raise ValueError(f"HDF5Video input_format={value} invalid.")
 
         if value == "channels_first":
+            logger.warning(
+                "HDF5Video with input_format='channels_first' requires a transpose "
+                "for every frame read. Consider converting it with "
+                "HDF5Video.rechunk_to_channels_last()."
+            )
             self.__channel_idx = 1
             self.__width_idx = 2
             self.__height_idx = 3
@@ -103,12 +478,8 @@ class HDF5Video:
             self.__file_h5 = self.filename
             self.filename = self.__file_h5.filename
         elif type(self.filename) is str:
-            try:
-                self.__file_h5 = h5.File(self.filename, "r")
-            except OSError as ex:
-                raise FileNotFoundError(
-                    f"Could not find HDF5 file {self.filename}"
-                ) from ex
+            # Share the file handle with other videos stored in the same file.
+            self.__file_h5, self._file_key_ = _acquire_hdf5_file(self.filename)
         else:
             self.__file_h5 = None
 
@@ -132,11 +503,12 @@ class HDF5Video:
             # Check for frame_numbers dataset corresponding to video
             framenum_dataset = f"{base_dataset_path}/frame_numbers"
             if framenum_dataset in self.__file_h5:
-                original_idx_lists = self.__file_h5[framenum_dataset]
+                # Read all frame numbers at once rather than one element at a time.
+                original_idx_lists = self.__file_h5[framenum_dataset][:].tolist()
                 # Create map from idx in original video to idx in current
-                for current_idx in range(len(original_idx_lists)):
-                    original_idx = original_idx_lists[current_idx]
-                    self.__original_to_current_frame_idx[original_idx] = current_idx
+                self.__original_to_current_frame_idx = dict(
+                    zip(original_idx_lists, range(len(original_idx_lists)))
+                )
 
             source_video_group = f"{base_dataset_path}/source_video"
             if source_video_group in self.__file_h5:
@@ -216,24 +588,91 @@ class HDF5Video:
             True if attributes match, False otherwise.
         """
         return (
-            self.filename == other.filename
+            self._real_filename == other._real_filename
             and self.dataset == other.dataset
             and self.convert_range == other.convert_range
             and self.input_format == other.input_format
         )
 
+    @property
+    def _real_filename(self):
+        """Return the filename with symlinks and relative paths resolved."""
+        if self._file_key_ is not None:
+            return self._file_key_
+        if type(self.filename) is str:
+            return os.path.realpath(self.filename)
+        return self.filename
+
     def close(self):
         """Close the HDF5 file object (if it's open)."""
-        try:
-            self.__file_h5.close()
-        except:
-            pass
+        if self._file_key_ is not None:
+            # The file handle is shared, so only close it once no video uses it.
+            try:
+                _release_hdf5_file(self._file_key_)
+            except:
+                pass
+            self._file_key_ = None
+        else:
+            try:
+                self.__file_h5.close()
+            except:
+                pass
         self.__file_h5 = None
 
     def __del__(self):
         """Releases file object."""
         self.close()
 
+    def rechunk_to_channels_last(
+        self, path: str, dataset: str, compression: Optional[str] = "lzf"
+    ) -> "Video":
+        """Write a copy of the video data in "channels_last" format.
+
+        The data is stored with one frame per chunk so that reading a single frame
+        reads a single contiguous chunk and does not require a transpose.
+
+        Args:
+            path: Filename of the HDF5 file to write to (which could already exist).
+            dataset: Name of the HDF5 dataset to create.
+            compression: HDF5 compression filter to apply to the new dataset.
+
+        Returns:
+            A new Video object that references the new HDF5 dataset.
+        """
+        self._load()
+        src = self.__dataset_h5
+        if src.attrs.get("format", ""):
+            raise ValueError("Cannot rechunk video stored as encoded images.")
+
+        n_frames = src.shape[0]
+        frame_shape = (self.height, self.width, self.channels)
+
+        # Read in blocks aligned to the source chunks if possible.
+        block_size = src.chunks[0] if src.chunks is not None else 64
+
+        with h5.File(path, "a") as f:
+            dst = f.create_dataset(
+                dataset,
+                shape=(n_frames,) + frame_shape,
+                dtype=src.dtype,
+                chunks=(1,) + frame_shape,
+                compression=compression,
+            )
+            for start in range(0, n_frames, block_size):
+                block = src[start : start + block_size]
+                if self.input_format == "channels_first":
+                    block = np.transpose(block, (0, 3, 2, 1))
+                dst[start : start + len(block)] = block
+
+        return Video(
+            backend=HDF5Video(
+                filename=path,
+                dataset=dataset,
+                input_format="channels_last",
+                convert_range=self.convert_range,
+            )
+        )
+
     def _try_frame_from_source_video(self, idx) -> np.ndarray:
         try:
             return self.source_video.get_frame(idx)
@@ -329,7 +768,8 @@ class HDF5Video:
             frame = np.transpose(frame, (2, 1, 0))
 
         if self.convert_range and np.max(frame) <= 1.0:
-            frame = (frame * 255).astype(int)
+            # Clip so that negative values don't wrap around when cast to uint8.
+            frame = np.clip(frame * 255, 0, 255).astype(np.uint8)
 
         return frame
 
@@ -347,6 +787,10 @@ class MediaVideo:
         grayscale: Whether the video is grayscale or not. "auto" means detect
             based on first frame.
         bgr: Whether color channels ordered as (blue, green, red).
+        reader_backend: Library used to decode frames. Either "opencv" (the
+            default) or "pyav". PyAV decodes directly into RGB and is faster for
+            sequential reads, but requires the optional `av` package. Video
+            metadata is always read with OpenCV.
     """
 
     filename: str = attr.ib()
@@ -357,9 +801,20 @@ class MediaVideo:
     dataset: str = attr.ib(default="")
     input_format: str = attr.ib(default="")
 
+    reader_backend: str = attr.ib(default="opencv")
+
     _detect_grayscale = False
     _reader_ = None
     _test_frame_ = None
+    _av_container_ = None
+    _av_frames_ = None
+    _av_next_idx_ = None
+
+    @reader_backend.validator
+    def _check_reader_backend(self, attribute, value):
+        """Called by attrs to validate the reader backend."""
+        if value not in ("opencv", "pyav"):
+            raise ValueError(f"MediaVideo reader_backend={value} invalid.")
 
     @property
     def __lock(self):
@@ -388,9 +843,13 @@ class MediaVideo:
             # If the user specified None for grayscale bool, figure it out based on the
             # the first frame of data.
             if self._detect_grayscale is True:
-                self.grayscale = bool(
-                    np.alltrue(self.test_frame[..., 0] == self.test_frame[..., -1])
-                )
+                # Compare a sparse grid of pixels first so that color videos are
+                # rejected without scanning the whole frame, then confirm on the
+                # full frame.
+                frame = self.test_frame
+                self.grayscale = np.array_equal(
+                    frame[::16, ::16, 0], frame[::16, ::16, -1]
+                ) and np.array_equal(frame[..., 0], frame[..., -1])
 
         # Return cached reader
         return self._reader_
@@ -464,15 +923,112 @@ class MediaVideo:
     def reset(self):
         """Reloads the video."""
         self._reader_ = None
+        if self._av_container_ is not None:
+            self._av_container_.close()
+        self._av_container_ = None
+        self._av_frames_ = None
+        self._av_next_idx_ = None
+
+    def _read_frame_av(self, idx: int) -> Optional[np.ndarray]:
+        """Decode a frame with PyAV, seeking only when reads are not sequential.
+
+        Returns the frame in RGB order if `bgr` is True (matching the OpenCV reader
+        after channel reversal), otherwise in BGR order, or None if the frame could
+        not be decoded.
+        """
+        if self._av_container_ is None:
+            if not os.path.isfile(self.filename):
+                raise FileNotFoundError(
+                    f"Could not find filename video filename named {self.filename}"
+                )
+            import av
+
+            self._av_container_ = av.open(self.filename)
+            self._av_container_.streams.video[0].thread_type = "AUTO"
+
+        stream = self._av_container_.streams.video[0]
+
+        if idx != self._av_next_idx_:
+            # Seek to the keyframe before the target, then decode up to it.
+            start_pts = stream.start_time or 0
+            target_pts = start_pts + int(
+                round(idx / (stream.average_rate * stream.time_base))
+            )
+            self._av_container_.seek(target_pts, stream=stream, backward=True)
+            self._av_frames_ = self._av_container_.decode(stream)
+            frame = next(self._av_frames_, None)
+            while frame is not None and (frame.pts or 0) < target_pts:
+                frame = next(self._av_frames_, None)
+        else:
+            frame = next(self._av_frames_, None)
+
+        if frame is None:
+            self._av_next_idx_ = None
+            return None
+
+        self._av_next_idx_ = idx + 1
+        return frame.to_ndarray(format="rgb24" if self.bgr else "bgr24")
+
+    def iter_frames(self, start: int, stop: int) -> Iterator[np.ndarray]:
+        """Decode a contiguous range of frames in order.
+
+        Frames are read with a separate reader that seeks once and then decodes
+        sequentially, so this does not hold the lock or move the position of the
+        reader used by `get_frame`.
+
+        Args:
+            start: Index of the first frame.
+            stop: Index after the last frame.
+
+        Yields:
+            Frames in the same format as returned by `get_frame`.
+        """
+        if self.reader_backend != "opencv":
+            for idx in range(start, stop):
+                yield self.get_frame(idx)
+            return
+
+        # Load the test frame first so that grayscale has been detected.
+        _ = self.test_frame
+        grayscale = self.grayscale
+
+        reader = cv2.VideoCapture(self.filename)
+        try:
+            if start > 0:
+                reader.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+            for idx in range(start, stop):
+                success, frame = reader.read()
+                if not success or frame is None:
+                    raise KeyError(f"Unable to load frame {idx} from {self}.")
+
+                # OpenCV reads frames in BGR order.
+                if self.bgr:
+                    frame = frame[..., ::-1]
+
+                if grayscale:
+                    frame = frame[..., -1 if self.bgr else 0][..., None]
+
+                yield frame
+        finally:
+            reader.release()
 
     def get_frame(self, idx: int, grayscale: bool = None) -> np.ndarray:
         """See :class:`Video`."""
 
         with self.__lock:
-            if self.__reader.get(cv2.CAP_PROP_POS_FRAMES) != idx:
-                self.__reader.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            if self.reader_backend == "pyav":
+                frame = self._read_frame_av(idx)
+                success = frame is not None
+            else:
+                if self.__reader.get(cv2.CAP_PROP_POS_FRAMES) != idx:
+                    self.__reader.set(cv2.CAP_PROP_POS_FRAMES, idx)
+
+                success, frame = self.__reader.read()
 
-            success, frame = self.__reader.read()
+                # OpenCV reads frames in BGR order.
+                if success and frame is not None and self.bgr:
+                    frame = frame[..., ::-1]
 
         if not success or frame is None:
             raise KeyError(f"Unable to load frame {idx} from {self}.")
@@ -481,10 +1037,7 @@ class MediaVideo:
             grayscale = self.grayscale
 
         if grayscale:
-            frame = frame[..., 0][..., None]
-
-        if self.bgr:
-            frame = frame[..., ::-1]
+            frame = frame[..., -1 if self.bgr else 0][..., None]
 
         return frame
 
@@ -515,7 +1068,9 @@ class NumpyVideo:
             self.filename = "Raw Video Data"
         elif type(self.filename) is str:
             try:
-                self.__data = np.load(self.filename)
+                # Memory-map the file so frames are paged in on demand instead of
+                # reading the whole video into memory.
+                self.__data = np.load(self.filename, mmap_mode="r")
             except OSError as ex:
                 raise FileNotFoundError(
                     f"Could not find filename {self.filename}"
@@ -523,8 +1078,26 @@ class NumpyVideo:
         else:
             self.__data = None
 
+        self.__signature = None
+
     def set_video_ndarray(self, data: np.ndarray):
         self.__data = data
+        self.__signature = None
+
+    @property
+    def _signature(self) -> Optional[tuple]:
+        """Cheap fingerprint of the data used to quickly tell videos apart.
+
+        This combines the shape, dtype and checksums of the first and last frames,
+        so computing it only touches two frames rather than the whole video.
+        """
+        if self.__signature is None and self.__data is not None:
+            data = self.__data
+            first_last = b""
+            if len(data) > 0:
+                first_last = np.ascontiguousarray(data[[0, -1]]).tobytes()
+            self.__signature = (data.shape, str(data.dtype), zlib.crc32(first_last))
+        return self.__signature
 
     # The properties and methods below complete our contract with the
     # higher level Video interface.
@@ -533,7 +1106,7 @@ class NumpyVideo:
     def test_frame(self):
         return self.get_frame(0)
 
-    def matches(self, other: "NumpyVideo") -> np.ndarray:
+    def matches(self, other: "NumpyVideo") -> bool:
         """
         Check if attributes match those of another video.
 
@@ -543,7 +1116,19 @@ class NumpyVideo:
         Returns:
             True if attributes match, False otherwise.
         """
-        return np.all(self.__data == other.__data)
+        if self.__data is other.__data:
+            return True
+
+        # Videos with different shapes, dtypes or boundary frames can't match, so
+        # we can avoid comparing the full arrays in most cases.
+        if self._signature != other._signature:
+            return False
+
+        # Same file on disk, so the contents are the same.
+        if self.filename != "Raw Video Data" and self.filename == other.filename:
+            return True
+
+        return np.array_equal(self.__data, other.__data)
 
     @property
     def frames(self):
@@ -915,6 +1500,22 @@ class SingleImageVideo:
         return self.__data[idx]
 
 
+# Shared converter returned by Video.cattr(), built on first use.
+_VIDEO_CATTR = None
+
+# Map from (lowercase) file extension to the video backend used to read it.
+VIDEO_BACKENDS_BY_EXTENSION = {
+    ".h5": HDF5Video,
+    ".hdf5": HDF5Video,
+    ".slp": HDF5Video,
+    ".npy": NumpyVideo,
+    ".mp4": MediaVideo,
+    ".avi": MediaVideo,
+    ".mov": MediaVideo,
+    ".mkv": MediaVideo,
+}
+
+
 @attr.s(auto_attribs=True, eq=False, order=False)
 class Video:
     """
@@ -1016,6 +1617,28 @@ class Video:
         """
         return self.backend.get_frame(idx)
 
+    def _iter_frames(
+        self, frame_numbers: Iterable[int], n_workers: int = 1
+    ) -> Iterator[np.ndarray]:
+        """Iterate over frames in order, decoding sequentially when possible.
+
+        If the backend is a :class:`MediaVideo` and the frame numbers are contiguous
+        and increasing, frames are decoded in one pass without seeking. Otherwise
+        each frame is read with `get_frame`. Frames are only read with `n_workers`
+        threads if the backend can be read from multiple threads at once (i.e.,
+        :class:`HDF5Video` and :class:`NumpyVideo`), since the other backends share a
+        single reader whose position concurrent reads would interfere with.
+        """
+        if isinstance(self.backend, MediaVideo) and len(frame_numbers) > 1:
+            frame_numbers_array = np.asarray(frame_numbers)
+            if np.all(np.diff(frame_numbers_array) == 1):
+                return self.backend.iter_frames(
+                    int(frame_numbers_array[0]), int(frame_numbers_array[-1]) + 1
+                )
+        if n_workers > 1 and isinstance(self.backend, (HDF5Video, NumpyVideo)):
+            return _threaded_map(self.get_frame, frame_numbers, n_workers=n_workers)
+        return map(self.get_frame, frame_numbers)
+
     def get_frames(self, idxs: Union[int, Iterable[int]]) -> np.ndarray:
         """Return a collection of video frames from the underlying video data.
 
@@ -1061,6 +1684,36 @@ class Video:
 
         return idxs_found, frames
 
+    def get_frames_gpu(
+        self, idxs: Union[int, Iterable[int]], device_name: Optional[Text] = None
+    ) -> "tf.Tensor":
+        """Return a collection of video frames as a tensor on the GPU.
+
+        Frames are decoded on the CPU and stacked into a single contiguous buffer so
+        that they are copied to the device in one transfer instead of one per frame.
+
+        Args:
+            idxs: An iterable object that contains the indices of frames.
+            device_name: Name of the device to place the frames on. If not
+                specified, the first GPU will be used if available, otherwise the
+                CPU.
+
+        Returns:
+            The requested video frames as a `tf.Tensor` with shape
+            (len(idxs), height, width, channels).
+
+        See also: Video.get_frames, sleap.nn.system.best_logical_device_name
+        """
+        import tensorflow as tf
+        from sleap.nn.system import best_logical_device_name
+
+        if device_name is None:
+            device_name = best_logical_device_name()
+
+        frames = np.ascontiguousarray(self.get_frames(idxs))
+        with tf.device(device_name):
+            return tf.identity(tf.convert_to_tensor(frames))
+
     def __getitem__(self, idxs):
         if isinstance(idxs, slice):
             start, stop, step = idxs.indices(self.num_frames)
@@ -1174,17 +1827,16 @@ class Video:
         """
         filename = Video.fixup_path(filename)
 
-        if filename.lower().endswith(("h5", "hdf5", "slp")):
-            backend_class = HDF5Video
-        elif filename.endswith(("npy")):
-            backend_class = NumpyVideo
-        elif filename.lower().endswith(("mp4", "avi", "mov")):
-            backend_class = MediaVideo
+        ext = os.path.splitext(filename)[1].lower()
+        backend_class = VIDEO_BACKENDS_BY_EXTENSION.get(ext, None)
+
+        if backend_class is MediaVideo:
             kwargs["dataset"] = ""  # prevent serialization from breaking
-        elif os.path.isdir(filename) or "metadata.yaml" in filename:
-            backend_class = ImgStoreVideo
-        else:
-            raise ValueError("Could not detect backend for specified filename.")
+        elif backend_class is None:
+            if os.path.isdir(filename) or "metadata.yaml" in filename:
+                backend_class = ImgStoreVideo
+            else:
+                raise ValueError("Could not detect backend for specified filename.")
 
         kwargs["filename"] = filename
 
@@ -1213,9 +1865,14 @@ class Video:
         )
 
         # read each frame and write it to the imgstore
-        # unfortunately imgstore doesn't let us just add the file
-        for i, img_filename in enumerate(filenames):
-            img = cv2.imread(img_filename, flags=cv2.IMREAD_COLOR)
+        # unfortunately imgstore doesn't let us just add the file, but we can at
+        # least decode the images in parallel (cv2.imread releases the GIL) while
+        # the store encodes and writes them in order.
+        def read_img(img_filename):
+            return cv2.imread(img_filename, flags=cv2.IMREAD_COLOR)
+
+        imgs = _threaded_map(read_img, filenames, n_workers=usable_cpu_count())
+        for i, img in enumerate(imgs):
             store.add_image(img, i, i)
 
         store.close()
@@ -1226,9 +1883,10 @@ class Video:
     def to_imgstore(
         self,
         path: str,
-        frame_numbers: List[int] = None,
+        frame_numbers: Iterable[int] = None,
         format: str = "png",
         index_by_original: bool = True,
+        n_workers: int = 1,
     ) -> "Video":
         """Convert frames from arbitrary video backend to ImgStoreVideo.
 
@@ -1236,8 +1894,8 @@ class Video:
 
         Args:
             path: Filename or directory name to store imgstore.
-            frame_numbers: A list of frame numbers from the video to save.
-                If None save the entire video.
+            frame_numbers: A list or iterable of frame numbers from the video to
+                save. If None save the entire video.
             format: By default it will create a DirectoryImgStore with lossless
                 PNG format unless the frame_indices = None, in which case,
                 it will default to 'mjpeg/avi' format for video.
@@ -1249,6 +1907,10 @@ class Video:
                 Default to True so that we can use an ImgStoreVideo in a
                 dataset to replace another video without having to update
                 all the frame indices on :class:`LabeledFrame` objects in the dataset.
+            n_workers: Number of threads used to read frames that are not contiguous
+                in the source video. This is only used for backends that support
+                concurrent reads (HDF5 and numpy); frames are read sequentially from
+                other backends. Defaults to 1 (sequential reads).
 
         Returns:
             A new Video object that references the imgstore.
@@ -1285,16 +1947,35 @@ class Video:
         # of the imgstore for posterity
         store.add_extra_data(source_sleap_video_obj=Video.cattr().unstructure(self))
 
-        import time
+        # Read frames in a background thread while the store encodes and writes.
+        # Encoding in add_image is usually the slower stage, so let the reader
+        # run further ahead to absorb stalls (e.g., at keyframes or chunk rollover).
+        if hasattr(frame_numbers, "__len__"):
+            frames = zip(
+                frame_numbers,
+                _prefetch(
+                    self._iter_frames(frame_numbers, n_workers=n_workers), prefetch=16
+                ),
+            )
+        else:
+            # Frame numbers from an iterator can only be read once, so keep each
+            # frame number together with its frame.
+            frames = _prefetch_map(
+                lambda frame_num: (frame_num, self.get_frame(frame_num)),
+                frame_numbers,
+                prefetch=16,
+            )
 
-        for frame_num in frame_numbers:
-            store.add_image(self.get_frame(frame_num), frame_num, time.time())
+        n_written = 0
+        for frame_num, frame in frames:
+            store.add_image(frame, frame_num, time.time())
+            n_written += 1
 
         # If there are no frames to save for this video, add a dummy frame
         # since we can't save an empty imgstore.
-        if len(frame_numbers) == 0:
+        if n_written == 0:
             store.add_image(
-                np.zeros((self.height, self.width, self.channels)), 0, time.time()
+                _zero_frame((self.height, self.width, self.channels)), 0, time.time()
             )
 
         store.close()
@@ -1311,6 +1992,9 @@ class Video:
         frame_numbers: List[int] = None,
         format: str = "",
         index_by_original: bool = True,
+        compression: Optional[str] = "lzf",
+        compression_opts=None,
+        encode_params: Optional[List[int]] = None,
     ):
         """Convert frames from arbitrary video backend to HDF5Video.
 
@@ -1322,7 +2006,9 @@ class Video:
             frame_numbers: A list of frame numbers from the video to save.
                 If None save the entire video.
             format: If non-empty, then encode images in format before saving.
-                Otherwise, save numpy matrix of frames.
+                Otherwise, save numpy matrix of frames. Any image format supported
+                by `cv2.imencode` can be used, e.g., "png" (lossless), "jpg"
+                (lossy, but much faster to encode) or "ppm" (uncompressed, fastest).
             index_by_original: If the index_by_original is set to True then
                 the get_frame function will accept the original frame
                 numbers of from original video.
@@ -1330,6 +2016,15 @@ class Video:
                 Default to True so that we can use resulting video in a
                 dataset to replace another video without having to update
                 all the frame indices in the dataset.
+            compression: Compression filter used for the frames when no `format`
+                is specified. Defaults to "lzf", which is much faster than "gzip".
+                Use "blosc" for Blosc/LZ4 if `hdf5plugin` is installed (note that
+                reading the file will then also require `hdf5plugin`).
+            compression_opts: Options for the compression filter, e.g., the
+                compression level for "gzip" or "blosc".
+            encode_params: Parameters passed to `cv2.imencode` when a `format` is
+                specified, e.g., `[cv2.IMWRITE_JPEG_QUALITY, 90]` or
+                `[cv2.IMWRITE_PNG_COMPRESSION, 1]`.
 
         Returns:
             A new Video object that references the HDF5 dataset.
@@ -1338,42 +2033,120 @@ class Video:
         if frame_numbers is None:
             frame_numbers = range(self.num_frames)
 
-        if frame_numbers:
-            frame_data = self.get_frames(frame_numbers)
+        n_frames = len(frame_numbers)
+        if isinstance(frame_numbers, range):
+            frame_numbers_data = np.arange(
+                frame_numbers.start,
+                frame_numbers.stop,
+                frame_numbers.step,
+                dtype=np.int64,
+            )
         else:
-            frame_data = np.zeros((1, 1, 1, 1))
-
-        frame_numbers_data = np.array(list(frame_numbers), dtype=int)
+            frame_numbers_data = np.asarray(frame_numbers, dtype=np.int64)
 
         with h5.File(path, "a") as f:
 
             if format:
 
+                ext = "." + format
+                params = list(encode_params) if encode_params is not None else []
+
                 def encode(img):
-                    _, encoded = cv2.imencode("." + format, img)
-                    return np.squeeze(encoded)
+                    _, encoded = cv2.imencode(ext, img, params)
+                    # View as the dataset dtype so h5py doesn't need to convert it.
+                    return encoded.reshape(-1).view(np.int8)
 
                 dtype = h5.special_dtype(vlen=np.dtype("int8"))
-                dset = f.create_dataset(
-                    dataset + "/video", (len(frame_numbers),), dtype=dtype
-                )
+                dset = f.create_dataset(dataset + "/video", (n_frames,), dtype=dtype)
                 dset.attrs["format"] = format
                 dset.attrs["channels"] = self.channels
                 dset.attrs["height"] = self.height
                 dset.attrs["width"] = self.width
 
-                for i in range(len(frame_numbers)):
-                    dset[i] = encode(frame_data[i])
-            else:
-                f.create_dataset(
-                    dataset + "/video",
-                    data=frame_data,
-                    compression="gzip",
-                    compression_opts=9,
+                def write_batch(start, batch):
+                    # Writing a slice of variable-length elements in one call is
+                    # much cheaper than writing each element separately.
+                    data = np.empty(len(batch), dtype=object)
+                    for j, encoded in enumerate(batch):
+                        data[j] = encoded
+                    dset[start : start + len(batch)] = data
+
+                # Read, encode and write frames concurrently.
+                frames = _prefetch(self._iter_frames(frame_numbers))
+                batch, batch_start, write_batch_size = [], 0, 64
+                for encoded in _prefetch_map(encode, frames):
+                    batch.append(encoded)
+                    if len(batch) == write_batch_size:
+                        write_batch(batch_start, batch)
+                        batch_start += len(batch)
+                        batch = []
+                if batch:
+                    write_batch(batch_start, batch)
+            elif n_frames > 0:
+                # Write frames a chunk at a time as they are read so that we never
+                # need to hold the whole video in memory, and each chunk is
+                # compressed exactly once.
+                blocks = _iter_chunk_blocks(
+                    _prefetch(self._iter_frames(frame_numbers)), n_frames
                 )
 
+                # Chunks that are uncompressed or gzip compressed can be encoded in
+                # parallel here and written directly, bypassing the filter pipeline.
+                direct_write = compression in (None, "gzip")
+                if direct_write:
+                    level = 4 if compression_opts is None else compression_opts
+
+                    def encode_block(item):
+                        start, n, block = item
+                        return start, n, block, _encode_chunk(block, compression, level)
+
+                    # Blocks can be whole frames, so only keep about one in flight
+                    # per worker to bound memory use.
+                    n_workers = min(usable_cpu_count(), 8)
+                    blocks = _threaded_map(
+                        encode_block, blocks, n_workers=n_workers, max_pending=n_workers
+                    )
+
+                dset = None
+                for start, n, block, *encoded in blocks:
+                    if dset is None:
+                        dset = f.create_dataset(
+                            dataset + "/video",
+                            shape=(n_frames,) + block.shape[1:],
+                            dtype=block.dtype,
+                            chunks=block.shape,
+                            **_hdf5_compression_kwargs(
+                                compression,
+                                compression_opts,
+                                shuffle=block.dtype.itemsize > 1,
+                            ),
+                        )
+
+                    if direct_write:
+                        offset = (start,) + (0,) * (block.ndim - 1)
+                        dset.id.write_direct_chunk(offset, encoded[0])
+                    else:
+                        dset[start : start + n] = block[:n]
+            else:
+                f.create_dataset(dataset + "/video", data=np.zeros((1, 1, 1, 1)))
+
             if index_by_original:
-                f.create_dataset(dataset + "/frame_numbers", data=frame_numbers_data)
+                # Frame numbers are small increasing integers, so they shrink a lot
+                # with a narrower dtype and byte shuffling before compression.
+                if n_frames > 0:
+                    if frame_numbers_data.max() <= np.iinfo(np.int32).max:
+                        frame_numbers_data = frame_numbers_data.astype(np.int32)
+                    f.create_dataset(
+                        dataset + "/frame_numbers",
+                        data=frame_numbers_data,
+                        chunks=True,
+                        compression="lzf",
+                        shuffle=True,
+                    )
+                else:
+                    f.create_dataset(
+                        dataset + "/frame_numbers", data=frame_numbers_data
+                    )
 
             source_video_group = f.require_group(dataset + "/source_video")
             source_video_dict = Video.cattr().unstructure(self)
@@ -1438,31 +2211,51 @@ class Video:
         """Return a cattr converter for serialiazing/deserializing Video objects.
 
         Returns:
-            A cattr converter.
+            A cattr converter. This is built once and shared between calls.
         """
+        global _VIDEO_CATTR
+        if _VIDEO_CATTR is None:
+            _VIDEO_CATTR = Video._make_cattr()
+        return _VIDEO_CATTR
+
+    @staticmethod
+    def _make_cattr():
+        """Build the cattr converter returned by `Video.cattr()`."""
 
         # When we are structuring video backends, try to fixup the video file paths
         # in case they are coming from a different computer or the file has been moved.
-        def fixup_video(x, cl):
-            if "filename" in x:
-                x["filename"] = Video.fixup_path(x["filename"])
-            if "file" in x:
-                x["file"] = Video.fixup_path(x["file"])
+        # The hook is specialized for each backend class so that its attribute names
+        # are only looked up once.
+        def make_fixup_video(backend_class):
+            field_names = frozenset(attr.fields_dict(backend_class).keys())
+            path_field = "filename" if "filename" in field_names else "file"
+
+            def fixup_video(x, cl):
+                if path_field in x:
+                    x[path_field] = Video.fixup_path(x[path_field])
+
+                # Only pass through the kwargs that match attributes for the backend.
+                return backend_class(
+                    **{key: val for key, val in x.items() if key in field_names}
+                )
 
-            return Video.make_specific_backend(cl, x)
+            return fixup_video
 
         vid_cattr = cattr.Converter()
 
         # Check the type hint for backend and register the video path
         # fixup hook for each type in the Union.
         for t in attr.fields(Video).backend.type.__args__:
-            vid_cattr.register_structure_hook(t, fixup_video)
+            vid_cattr.register_structure_hook(t, make_fixup_video(t))
 
         return vid_cattr
 
     @staticmethod
     def fixup_path(
-        path: str, raise_error: bool = False, raise_warning: bool = False
+        path: str,
+        raise_error: bool = False,
+        raise_warning: bool = False,
+        search_dirs: Optional[List[str]] = None,
     ) -> str:
         """Try to locate video if the given path doesn't work.
 
@@ -1472,7 +2265,7 @@ class Video:
         on the backend object. If this is an absolute path it is almost
         certainly wrong when transferred when the object is created on
         another computer. We try to find the video by looking in the current
-        working directory as well.
+        working directory and then in each of the search directories.
 
         Note that when loading videos during the process of deserializing a
         saved :class:`Labels` dataset, it's usually preferable to fix video
@@ -1482,6 +2275,10 @@ class Video:
             path: The path the video asset.
             raise_error: Whether to raise error if we cannot find video.
             raise_warning: Whether to raise warning if we cannot find video.
+            search_dirs: Directories to look for the video in if it is not found
+                at its path or in the current working directory. Defaults to
+                `VIDEO_SEARCH_DIRS`, which is read from the `SLEAP_VIDEO_SEARCH_DIRS`
+                environment variable.
 
         Raises:
             FileNotFoundError: If file still cannot be found and raise_error
@@ -1495,23 +2292,24 @@ class Video:
         if type(path) is not str:
             return path
 
-        if os.path.exists(path):
+        if _path_exists(path):
             return path
 
-        # Strip the directory and lets see if the file is in the current working
-        # directory.
-        elif os.path.exists(os.path.basename(path)):
-            return os.path.basename(path)
-
         # Special case: this is an ImgStore path! We cant use
-        # basename because it will strip the directory name off
-        elif path.endswith("metadata.yaml"):
+        # basename because it will strip the directory name off, so we look
+        # for the parent dir of the YAML file instead.
+        if path.endswith("metadata.yaml"):
+            name = os.path.basename(os.path.split(path)[0])
+        else:
+            name = os.path.basename(path)
 
-            # Get the parent dir of the YAML file.
-            img_store_dir = os.path.basename(os.path.split(path)[0])
+        if search_dirs is None:
+            search_dirs = VIDEO_SEARCH_DIRS
 
-            if os.path.exists(img_store_dir):
-                return img_store_dir
+        # Check the current working directory first, then the search dirs.
+        for candidate in [name] + [os.path.join(d, name) for d in search_dirs]:
+            if _path_exists(candidate):
+                return candidate
 
         if raise_error:
             raise FileNotFoundError(f"Cannot find a video file: {path}")
@@ -24,7 +24,9 @@ Conveniently, this format also provides a single location where all user-facing
 parameters are aggregated and documented for end users (as opposed to developers).
 """
 
+import functools
 import os
+import re
 import attr
 import cattr
 import sleap
@@ -32,10 +34,37 @@ from sleap.nn.config.data import DataConfig
 from sleap.nn.config.model import ModelConfig
 from sleap.nn.config.optimization import OptimizationConfig
 from sleap.nn.config.outputs import OutputsConfig
-import json
-from jsmin import jsmin
+import rapidjson
+from sleap.util import json_loads
 from typing import Text, Dict, Any, Optional
 
+# Matches JSON strings (group 1) or JavaScript style comments. Strings are matched so
+# that comment markers inside them (e.g., in "//server/share" paths) are kept.
+_JSON_COMMENTS_PATTERN = re.compile(r'("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/', re.S)
+
+
+def strip_json_comments(json_data: Text) -> Text:
+    """Remove `//` and `/* */` comments from JSON text.
+
+    Arguments:
+        json_data: JSON-formatted string that may contain comments.
+
+    Returns:
+        The JSON text with comments removed. Comment markers within strings are kept.
+    """
+    return _JSON_COMMENTS_PATTERN.sub(lambda m: m.group(1) or "", json_data)
+
+
+@functools.lru_cache(maxsize=32)
+def _read_json_file(path: Text, mtime_ns: int, size: int) -> Text:
+    """Read a JSON file with comments removed, caching the most recent files.
+
+    The modification time and size are part of the cache key so that a file that
+    was changed since it was last read is read again.
+    """
+    with open(path, "r") as f:
+        return strip_json_comments(f.read())
+
 
 @attr.s(auto_attribs=True)
 class TrainingJobConfig:
@@ -86,7 +115,7 @@ class TrainingJobConfig:
             A TrainingJobConfig instance parsed from the JSON text.
         """
         # Open and parse the JSON data into dictionaries.
-        json_data_dicts = json.loads(jsmin(json_data))
+        json_data_dicts = json_loads(strip_json_comments(json_data))
         return cls.from_json_dicts(json_data_dicts)
 
     @classmethod
@@ -115,11 +144,14 @@ class TrainingJobConfig:
         if os.path.isdir(filename):
             filename = os.path.join(filename, "training_config.json")
 
-        # Open and read the JSON data.
-        with open(filename, "r") as f:
-            json_data = f.read()
+        # Read the file only if it is new or has changed since it was last loaded.
+        # The text is parsed on every load so that each config is a new object.
+        stat = os.stat(filename)
+        json_data = _read_json_file(
+            os.path.realpath(filename), stat.st_mtime_ns, stat.st_size
+        )
 
-        obj = cls.from_json(json_data)
+        obj = cls.from_json_dicts(json_loads(json_data))
         obj.filename = filename
         return obj
 
@@ -130,7 +162,7 @@ class TrainingJobConfig:
             The JSON encoded string representation of the configuration.
         """
         json_dicts = cattr.unstructure(self)
-        return json.dumps(json_dicts, indent=4)
+        return rapidjson.dumps(json_dicts, indent=4)
 
     def save_json(self, filename: Text):
         """Save the configuration to a JSON file.
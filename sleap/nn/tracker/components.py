@@ -12,9 +12,10 @@ Main types of functions:
 
 
 """
+import math
 import operator
 from collections import defaultdict
-from typing import List, Tuple, Optional, TypeVar, Callable
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
 import attr
 import numpy as np
@@ -23,68 +24,264 @@ from scipy.optimize import linear_sum_assignment
 from sleap import PredictedInstance, Instance, Track
 from sleap.nn import utils
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import lap
+except ImportError:
+    lap = None
+
 InstanceType = TypeVar("InstanceType", Instance, PredictedInstance)
 
 
+if numba is not None:
+
+    @numba.njit
+    def _points_similarity(ref_points: np.ndarray, query_points: np.ndarray) -> float:
+        """Computes similarity between point arrays in a single compiled loop."""
+        similarity = 0.0
+        n_visible = 0
+        for i in range(ref_points.shape[0]):
+            ref_x, ref_y = ref_points[i, 0], ref_points[i, 1]
+            if np.isnan(ref_x) or np.isnan(ref_y):
+                continue
+            n_visible += 1
+
+            query_x, query_y = query_points[i, 0], query_points[i, 1]
+            if np.isnan(query_x) or np.isnan(query_y):
+                continue
+            similarity += np.exp(-((query_x - ref_x) ** 2 + (query_y - ref_y) ** 2))
+
+        if n_visible == 0:
+            return np.nan
+        return similarity / n_visible
+
+
+else:
+
+    def _points_similarity(ref_points: np.ndarray, query_points: np.ndarray) -> float:
+        """Computes similarity between point arrays."""
+        ref_visible = ~(np.isnan(ref_points).any(axis=1))
+        dists = np.sum((query_points - ref_points) ** 2, axis=1)
+        similarity = np.nansum(np.exp(-dists)) / np.sum(ref_visible)
+
+        return similarity
+
+
 def instance_similarity(
     ref_instance: InstanceType, query_instance: InstanceType
 ) -> float:
     """Computes similarity between instances."""
 
-    ref_visible = ~(np.isnan(ref_instance.points_array).any(axis=1))
-    dists = np.sum(
-        (query_instance.points_array - ref_instance.points_array) ** 2, axis=1
-    )
-    similarity = np.nansum(np.exp(-dists)) / np.sum(ref_visible)
+    ref_points = ref_instance.points_array
+    query_points = query_instance.points_array
+
+    # The compiled loop does not check bounds, so don't let it read past the end of
+    # a smaller points array.
+    if ref_points.shape != query_points.shape:
+        raise ValueError(
+            "Cannot compute similarity between instances with points of shape "
+            f"{ref_points.shape} and {query_points.shape}."
+        )
+
+    return _points_similarity(ref_points, query_points)
+
+
+def instance_similarity_batch(
+    ref_points: np.ndarray, query_points: np.ndarray
+) -> np.ndarray:
+    """Computes similarity between all pairs of reference and query instances.
+
+    This is a batched version of `instance_similarity`.
+
+    Args:
+        ref_points: Points of the reference instances, shape (n_ref, n_nodes, 2).
+        query_points: Points of the query instances, shape (n_query, n_nodes, 2).
+
+    Returns:
+        The similarity matrix of shape (n_ref, n_query).
+    """
+
+    similarity = _instance_similarity_sums(ref_points, query_points)
+    similarity /= _visible_point_counts(ref_points)[:, None]
 
     return similarity
 
 
+def _instance_similarity_sums(
+    ref_points: np.ndarray, query_points: np.ndarray
+) -> np.ndarray:
+    """Computes `instance_similarity_batch` without normalizing by visible points.
+
+    The normalization only depends on the reference instance, so it can be applied
+    to each row after the best candidates have been picked.
+    """
+    dists = np.sum((query_points[None] - ref_points[:, None]) ** 2, axis=3)
+    return np.nansum(np.exp(-dists), axis=2)
+
+
+def _visible_point_counts(points: np.ndarray) -> np.ndarray:
+    """Returns the number of visible points for each instance in a points array."""
+    return np.sum(~(np.isnan(points).any(axis=2)), axis=1)
+
+
 def centroid_distance(
-    ref_instance: InstanceType, query_instance: InstanceType, cache: dict = dict()
+    ref_instance: InstanceType, query_instance: InstanceType
 ) -> float:
-    """Returns the negative distance between the centroids of two instances.
+    """Returns the negative distance between the centroids of two instances."""
 
-    Uses `cache` dictionary (created with function so it persists between calls)
-    since without cache this method is significantly slower than others.
-    """
+    a = ref_instance.centroid
+    b = query_instance.centroid
 
-    if ref_instance not in cache:
-        cache[ref_instance] = ref_instance.centroid
+    return -math.hypot(a[0] - b[0], a[1] - b[1])
 
-    if query_instance not in cache:
-        cache[query_instance] = query_instance.centroid
 
-    a = cache[ref_instance]
-    b = cache[query_instance]
+def centroid_distance_batch(
+    ref_centroids: np.ndarray, query_centroids: np.ndarray
+) -> np.ndarray:
+    """Returns the negative distances between all pairs of instance centroids.
 
-    return -np.linalg.norm(a - b)
+    This is a batched version of `centroid_distance`.
 
+    Args:
+        ref_centroids: Centroids of the reference instances, shape (n_ref, 2).
+        query_centroids: Centroids of the query instances, shape (n_query, 2).
 
-def instance_iou(
-    ref_instance: InstanceType, query_instance: InstanceType, cache: dict = dict()
-) -> float:
-    """Computes IOU between bounding boxes of instances."""
+    Returns:
+        The negative distance matrix of shape (n_ref, n_query).
+    """
+
+    return -np.linalg.norm(query_centroids[None] - ref_centroids[:, None], axis=2)
 
-    if ref_instance not in cache:
-        cache[ref_instance] = ref_instance.bounding_box
 
-    if query_instance not in cache:
-        cache[query_instance] = query_instance.bounding_box
+def instance_iou(ref_instance: InstanceType, query_instance: InstanceType) -> float:
+    """Computes IOU between bounding boxes of instances."""
 
-    a = cache[ref_instance]
-    b = cache[query_instance]
+    a = ref_instance.bounding_box
+    b = query_instance.bounding_box
 
     return utils.compute_iou(a, b)
 
 
+# Batched versions of pairwise similarity functions, keyed by the pairwise function.
+# Values are tuples of the batched function, a function that returns the feature
+# array of an instance that is stacked to form the batched function inputs, and an
+# optional function that returns a divisor for each row of the batched similarities
+# given the stacked reference features. The divisors are applied after picking the
+# best candidate for each track, which is equivalent since they are positive.
+batch_similarity_functions = {
+    instance_similarity: (
+        _instance_similarity_sums,
+        operator.attrgetter("points_array"),
+        _visible_point_counts,
+    ),
+    centroid_distance: (
+        centroid_distance_batch,
+        operator.attrgetter("centroid"),
+        None,
+    ),
+    instance_iou: (
+        utils.compute_iou_matrix,
+        operator.attrgetter("bounding_box"),
+        None,
+    ),
+}
+
+
 def hungarian_matching(cost_matrix: np.ndarray) -> List[Tuple[int, int]]:
-    """Wrapper for Hungarian matching algorithm in scipy."""
+    """Wrapper for Hungarian matching algorithm.
+
+    Uses the Jonker-Volgenant solver from `lap` if it is installed, which is faster
+    for the small cost matrices used in tracking, and otherwise uses scipy. `lap` is
+    only used if all costs are finite.
+    """
+
+    if lap is not None and cost_matrix.size > 0 and np.isfinite(cost_matrix).all():
+        _, row_to_col, _ = lap.lapjv(
+            np.asarray(cost_matrix, dtype=np.float64), extend_cost=True
+        )
+        return [
+            (row_ind, col_ind)
+            for row_ind, col_ind in enumerate(row_to_col)
+            if col_ind >= 0
+        ]
 
     row_ind, col_ind = linear_sum_assignment(cost_matrix)
     return list(zip(row_ind, col_ind))
 
 
+if numba is not None:
+
+    @numba.njit
+    def _greedy_assign(
+        rows: np.ndarray, cols: np.ndarray, n_rows: int, n_cols: int
+    ) -> np.ndarray:
+        """Assigns edges in order, skipping edges whose row or column is already used.
+
+        Args:
+            rows: Row indices of the edges, sorted by ascending cost.
+            cols: Column indices of the edges, sorted by ascending cost.
+            n_rows: Number of rows in the cost matrix.
+            n_cols: Number of columns in the cost matrix.
+
+        Returns:
+            Array of shape (n_assignments, 2) with the row and column of each assigned
+            edge, in the order they were assigned.
+        """
+        row_used = np.zeros(n_rows, np.bool_)
+        col_used = np.zeros(n_cols, np.bool_)
+        max_assignments = min(n_rows, n_cols)
+        assignments = np.empty((max_assignments, 2), np.int64)
+        k = 0
+        for e in range(rows.size):
+            if k == max_assignments:
+                break
+            row_ind = rows[e]
+            col_ind = cols[e]
+            if not row_used[row_ind] and not col_used[col_ind]:
+                assignments[k, 0] = row_ind
+                assignments[k, 1] = col_ind
+                k += 1
+                row_used[row_ind] = True
+                col_used[col_ind] = True
+        return assignments[:k]
+
+
+else:
+
+    def _greedy_assign(
+        rows: np.ndarray, cols: np.ndarray, n_rows: int, n_cols: int
+    ) -> List[Tuple[int, int]]:
+        """Assigns edges in order, skipping edges whose row or column is already used.
+
+        Args:
+            rows: Row indices of the edges, sorted by ascending cost.
+            cols: Column indices of the edges, sorted by ascending cost.
+            n_rows: Number of rows in the cost matrix.
+            n_cols: Number of columns in the cost matrix.
+
+        Returns:
+            List of (row, column) tuples of the assigned edges, in the order they were
+            assigned.
+        """
+        row_used = [False] * n_rows
+        col_used = [False] * n_cols
+        max_assignments = min(n_rows, n_cols)
+        assignments = []
+        # Iterate over Python ints, which is much faster than indexing into arrays.
+        for row_ind, col_ind in zip(rows.tolist(), cols.tolist()):
+            if len(assignments) == max_assignments:
+                break
+            if not row_used[row_ind] and not col_used[col_ind]:
+                assignments.append((row_ind, col_ind))
+                row_used[row_ind] = True
+                col_used[col_ind] = True
+        return assignments
+
+
 def greedy_matching(cost_matrix: np.ndarray) -> List[Tuple[int, int]]:
     """
     Performs greedy bipartite matching.
@@ -92,21 +289,13 @@ def greedy_matching(cost_matrix: np.ndarray) -> List[Tuple[int, int]]:
 
     # Sort edges by ascending cost.
     rows, cols = np.unravel_index(np.argsort(cost_matrix, axis=None), cost_matrix.shape)
-    unassigned_edges = list(zip(rows, cols))
 
     # Greedily assign edges.
-    assignments = []
-    while len(unassigned_edges) > 0:
-        # Assign the lowest cost edge.
-        row_ind, col_ind = unassigned_edges.pop(0)
-        assignments.append((row_ind, col_ind))
-
-        # Remove all other edges that contain either node (in reverse order).
-        for i in range(len(unassigned_edges) - 1, -1, -1):
-            if unassigned_edges[i][0] == row_ind or unassigned_edges[i][1] == col_ind:
-                del unassigned_edges[i]
+    assignments = _greedy_assign(
+        rows.astype(np.int64), cols.astype(np.int64), *cost_matrix.shape
+    )
 
-    return assignments
+    return [(row_ind, col_ind) for row_ind, col_ind in assignments]
 
 
 def nms_instances(
@@ -412,52 +601,113 @@ class FrameMatches:
         matching_function: Callable,
     ):
 
+        # Group candidate instances by track.
+        candidate_instances_by_track = defaultdict(list)
+        for instance in candidate_instances:
+            candidate_instances_by_track[instance.track].append(instance)
+
+        return cls.from_candidate_instances_by_track(
+            untracked_instances,
+            candidate_instances_by_track,
+            similarity_function,
+            matching_function,
+        )
+
+    @classmethod
+    def from_candidate_instances_by_track(
+        cls,
+        untracked_instances: List[InstanceType],
+        candidate_instances_by_track: Dict[Track, Sequence[InstanceType]],
+        similarity_function: Callable,
+        matching_function: Callable,
+    ):
+        """Calculates matches from candidate instances already grouped by track.
+
+        Tracks without any candidate instances should not be in
+        `candidate_instances_by_track`.
+        """
+
         cost = np.ndarray((0,))
         candidate_tracks = []
 
-        if candidate_instances:
-
-            # Group candidate instances by track.
-            candidate_instances_by_track = defaultdict(list)
-            for instance in candidate_instances:
-                candidate_instances_by_track[instance.track].append(instance)
+        if candidate_instances_by_track:
 
             # Compute similarity matrix between untracked instances and best
             # candidate for each track.
             candidate_tracks = list(candidate_instances_by_track.keys())
-            matching_similarities = np.full(
-                (len(untracked_instances), len(candidate_tracks)), np.nan
+            matching_similarities = best_track_similarities_batch(
+                untracked_instances,
+                candidate_tracks,
+                candidate_instances_by_track,
+                similarity_function,
             )
 
-            for i, untracked_instance in enumerate(untracked_instances):
-
-                for j, candidate_track in enumerate(candidate_tracks):
-                    # Compute similarity between untracked instance and all track
-                    # candidates.
-                    track_instances = candidate_instances_by_track[candidate_track]
-                    track_matching_similarities = [
-                        similarity_function(
-                            untracked_instance,
-                            candidate_instance,
-                        )
-                        for candidate_instance in track_instances
-                    ]
-
-                    # Keep the best scoring instance for this track.
-                    best_ind = np.argmax(track_matching_similarities)
-
-                    # Use the best similarity score for matching.
-                    best_similarity = track_matching_similarities[best_ind]
-                    matching_similarities[i, j] = best_similarity
+            if matching_similarities is None:
+                matching_similarities = cls._best_track_similarities(
+                    untracked_instances,
+                    candidate_tracks,
+                    candidate_instances_by_track,
+                    similarity_function,
+                )
 
             # Perform matching between untracked instances and candidates.
-            cost = -matching_similarities
-            cost[np.isnan(cost)] = np.inf
+            cost = np.negative(matching_similarities, dtype=np.float32)
+            np.nan_to_num(cost, copy=False, nan=np.inf, posinf=np.inf, neginf=-np.inf)
 
         return cls.from_cost_matrix(
             cost, untracked_instances, candidate_tracks, matching_function
         )
 
+    @staticmethod
+    def _best_track_similarities(
+        untracked_instances: List[InstanceType],
+        candidate_tracks: List[Track],
+        candidate_instances_by_track: Dict[Track, List[InstanceType]],
+        similarity_function: Callable,
+    ) -> np.ndarray:
+        """Computes the best similarity to each track one pair at a time."""
+        matching_similarities = np.full(
+            (len(untracked_instances), len(candidate_tracks)),
+            np.nan,
+            dtype=np.float32,
+        )
+
+        # Look up the candidates for each track once rather than for every instance.
+        track_instances_list = [
+            candidate_instances_by_track[candidate_track]
+            for candidate_track in candidate_tracks
+        ]
+
+        for i, untracked_instance in enumerate(untracked_instances):
+
+            for j, track_instances in enumerate(track_instances_list):
+                # Most tracks only have a single candidate, so there is no best
+                # candidate to pick.
+                if len(track_instances) == 1:
+                    matching_similarities[i, j] = similarity_function(
+                        untracked_instance, track_instances[0]
+                    )
+                    continue
+
+                # Compute similarity between untracked instance and all track
+                # candidates.
+                track_matching_similarities = [
+                    similarity_function(
+                        untracked_instance,
+                        candidate_instance,
+                    )
+                    for candidate_instance in track_instances
+                ]
+
+                # Keep the best scoring instance for this track.
+                best_ind = np.argmax(track_matching_similarities)
+
+                # Use the best similarity score for matching.
+                best_similarity = track_matching_similarities[best_ind]
+                matching_similarities[i, j] = best_similarity
+
+        return matching_similarities
+
     @classmethod
     def from_cost_matrix(
         cls,
@@ -510,6 +760,60 @@ class FrameMatches:
         )
 
 
+def best_track_similarities_batch(
+    untracked_instances: List[InstanceType],
+    candidate_tracks: List[Track],
+    candidate_instances_by_track: Dict[Track, List[InstanceType]],
+    similarity_function: Callable,
+) -> Optional[np.ndarray]:
+    """Computes the best similarity to the candidates of each track in one batch.
+
+    Args:
+        untracked_instances: The instances to compute similarities for.
+        candidate_tracks: The tracks to compute similarities to.
+        candidate_instances_by_track: Candidate instances for each track.
+        similarity_function: A pairwise similarity function.
+
+    Returns:
+        Matrix of shape (number of untracked instances, number of candidate tracks)
+        with the best similarity of each instance to the candidates of each track,
+        or None if `similarity_function` has no batched version in
+        `batch_similarity_functions` or the instance features can't be stacked.
+    """
+    if not untracked_instances:
+        return None
+    if similarity_function not in batch_similarity_functions:
+        return None
+    batch_function, get_features, get_row_divisors = batch_similarity_functions[
+        similarity_function
+    ]
+
+    track_sizes = [
+        len(candidate_instances_by_track[track]) for track in candidate_tracks
+    ]
+    ref_features = [get_features(instance) for instance in untracked_instances]
+    query_features = [
+        get_features(instance)
+        for track in candidate_tracks
+        for instance in candidate_instances_by_track[track]
+    ]
+    if len({features.shape for features in ref_features + query_features}) != 1:
+        return None
+
+    ref_features = np.stack(ref_features)
+    similarities = batch_function(ref_features, np.stack(query_features))
+
+    # Keep the best scoring candidate for each track. Candidates are grouped by track
+    # along the columns, so reduce over each group.
+    track_starts = np.cumsum([0] + track_sizes[:-1])
+    best_similarities = np.maximum.reduceat(similarities, track_starts, axis=1)
+
+    if get_row_divisors is not None:
+        best_similarities /= get_row_divisors(ref_features)[:, None]
+
+    return best_similarities
+
+
 def first_choice_matching(cost_matrix: np.ndarray) -> List[Tuple[int, int]]:
     """
     Returns match indices where each row gets matched to best column.
@@ -3,6 +3,7 @@
 from collections import deque, defaultdict
 import abc
 import attr
+import copy
 import numpy as np
 import cv2
 from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
@@ -35,6 +36,11 @@ class ShiftedInstance:
     track: Track = attr.ib()
     shift_score: np.ndarray = attr.ib()
 
+    # Cached geometry, computed on first access. The points of a shifted instance
+    # are not modified after it is created, so these never need to be invalidated.
+    _centroid: Optional[np.ndarray] = attr.ib(default=None, init=False, repr=False)
+    _bounding_box: Optional[np.ndarray] = attr.ib(default=None, init=False, repr=False)
+
     @property
     def points(self):
         return self.points_array
@@ -42,18 +48,21 @@ class ShiftedInstance:
     @property
     def centroid(self):
         """Copy of Instance method."""
-        points = self.points_array
-        centroid = np.nanmedian(points, axis=0)
-        return centroid
+        if self._centroid is None:
+            points = self.points_array
+            self._centroid = np.nanmedian(points, axis=0)
+        return self._centroid
 
     @property
     def bounding_box(self):
         """Copy of Instance method."""
-        points = self.points_array
-        bbox = np.concatenate(
-            [np.nanmin(points, axis=0)[::-1], np.nanmax(points, axis=0)[::-1]]
-        )
-        return bbox
+        if self._bounding_box is None:
+            points = self.points_array
+            bbox = np.empty(4, dtype=points.dtype)
+            bbox[:2] = np.nanmin(points, axis=0)[::-1]
+            bbox[2:] = np.nanmax(points, axis=0)[::-1]
+            self._bounding_box = bbox
+        return self._bounding_box
 
     @classmethod
     def from_instance(
@@ -106,12 +115,22 @@ class FlowCandidateMaker:
     def uses_image(self):
         return True
 
+    def prepare_image(self, img: np.ndarray) -> np.ndarray:
+        """Preprocesses a frame image for use with `get_candidates`.
+
+        `Tracker.track` calls this once for each frame, so that the preprocessed image
+        is stored in the matching queue and reused while the frame is a reference.
+        """
+        return self.preprocess_image(img, scale=self.img_scale)
+
     def get_candidates(
         self,
         track_matching_queue: Deque[MatchedFrameInstances],
         t: int,
         img: np.ndarray,
     ) -> List[ShiftedInstance]:
+        # The current image and the images in the queue have already been prepared
+        # with `prepare_image`.
         candidate_instances = []
         for matched_item in track_matching_queue:
             ref_t, ref_img, ref_instances = (
@@ -140,6 +159,39 @@ class FlowCandidateMaker:
                     self.shifted_instances[(ref_t, t)] = shifted_instances
         return candidate_instances
 
+    @staticmethod
+    def preprocess_image(img: np.ndarray, scale: float = 1.0) -> np.ndarray:
+        """Prepares an image for optical flow estimation.
+
+        Args:
+            img: Image as a numpy array or tensor.
+            scale: Factor to scale the image by.
+
+        Returns:
+            The image as a grayscale uint8 numpy array scaled by `scale`.
+        """
+
+        # Convert to uint8 for cv2.calcOpticalFlowPyrLK
+        img = ensure_int(img)
+
+        # Convert tensors to ndarays
+        if hasattr(img, "numpy"):
+            img = img.numpy()
+
+        # Ensure images are rank 2 in case there is a singleton channel dimension.
+        if img.ndim > 3:
+            img = np.squeeze(img)
+
+        # Convert RGB to grayscale.
+        if img.ndim > 2 and img.shape[-1] == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        # Input image scaling.
+        if scale != 1:
+            img = cv2.resize(img, None, None, scale, scale)
+
+        return img
+
     @staticmethod
     def flow_shift_instances(
         ref_instances: List[InstanceType],
@@ -154,13 +206,16 @@ class FlowCandidateMaker:
 
         Args:
             ref_instances: Reference instances in the previous frame.
-            ref_img: Previous frame image as a numpy array.
-            new_img: New frame image as a numpy array.
+            ref_img: Previous frame image, preprocessed with `preprocess_image` using
+                the same `scale`.
+            new_img: New frame image, preprocessed with `preprocess_image` using the
+                same `scale`.
             min_shifted_points: Minimum number of points that must be detected in the
                 new frame in order to generate a new shifted instance.
-            scale: Factor to scale the images by when computing optical flow. Decrease
-                this to increase performance at the cost of finer accuracy. Sometimes
-                decreasing the image scale can improve performance with fast movements.
+            scale: Factor that the images were scaled by when preprocessing them.
+                Decrease this to increase performance at the cost of finer accuracy.
+                Sometimes decreasing the image scale can improve performance with fast
+                movements.
             window_size: Optical flow window size to consider at each pyramid scale
                 level.
             max_levels: Number of pyramid scale levels to consider. This is different
@@ -175,40 +230,24 @@ class FlowCandidateMaker:
             This function relies on the Lucas-Kanade method for optical flow estimation.
         """
 
-        # Convert to uint8 for cv2.calcOpticalFlowPyrLK
-        ref_img = ensure_int(ref_img)
-        new_img = ensure_int(new_img)
-
-        # Convert tensors to ndarays
-        if hasattr(ref_img, "numpy"):
-            ref_img = ref_img.numpy()
-
-        if hasattr(new_img, "numpy"):
-            new_img = new_img.numpy()
-
-        # Ensure images are rank 2 in case there is a singleton channel dimension.
-        if ref_img.ndim > 3:
-            ref_img = np.squeeze(ref_img)
-            new_img = np.squeeze(new_img)
-
-        # Convert RGB to grayscale.
-        if ref_img.ndim > 2 and ref_img.shape[-1] == 3:
-            ref_img = cv2.cvtColor(ref_img, cv2.COLOR_BGR2GRAY)
-            new_img = cv2.cvtColor(new_img, cv2.COLOR_BGR2GRAY)
-
-        # Input image scaling.
-        if scale != 1:
-            ref_img = cv2.resize(ref_img, None, None, scale, scale)
-            new_img = cv2.resize(new_img, None, None, scale, scale)
-
-        # Gather reference points.
+        # Gather reference points into one buffer in scaled image coordinates.
         ref_pts = [inst.points_array for inst in ref_instances]
+        ref_pts_scaled = np.empty((sum(len(x) for x in ref_pts), 2), dtype="float32")
+        offset = 0
+        for pts in ref_pts:
+            np.multiply(
+                pts,
+                scale,
+                out=ref_pts_scaled[offset : offset + len(pts)],
+                casting="unsafe",
+            )
+            offset += len(pts)
 
         # Compute optical flow at all points.
         shifted_pts, status, errs = cv2.calcOpticalFlowPyrLK(
             ref_img,
             new_img,
-            (np.concatenate(ref_pts, axis=0)).astype("float32") * scale,
+            ref_pts_scaled,
             None,
             winSize=(window_size, window_size),
             maxLevel=max_levels,
@@ -220,25 +259,27 @@ class FlowCandidateMaker:
         )
         shifted_pts /= scale
 
-        # Split results by instances.
-        sections = np.cumsum([len(x) for x in ref_pts])[:-1]
-        shifted_pts = np.split(shifted_pts, sections, axis=0)
-        status = np.split(status, sections, axis=0)
-        status_sum = [np.sum(x) for x in status]
-        errs = np.split(errs, sections, axis=0)
+        # Exclude points that weren't found by optical flow. This is usually all of
+        # them, in which case there is nothing to mask.
+        found = status.reshape(-1) != 0
+        errs = errs.reshape(-1)
+        if not found.all():
+            shifted_pts[~found] = np.nan
 
-        # Create shifted instances.
+        # Create shifted instances from each instance's slice of the results.
         shifted_instances = []
-        for ref, pts, found, err in zip(ref_instances, shifted_pts, status, errs):
-            if found.sum() > min_shifted_points:
-                # Exclude points that weren't found by optical flow.
-                found = found.squeeze().astype(bool)
-                pts[~found] = np.nan
+        offset = 0
+        for ref, ref_inst_pts in zip(ref_instances, ref_pts):
+            start, offset = offset, offset + len(ref_inst_pts)
+            inst_found = found[start:offset]
 
+            if np.count_nonzero(inst_found) > min_shifted_points:
                 # Create a shifted instance.
                 shifted_instances.append(
                     ShiftedInstance.from_instance(
-                        ref, new_points_array=pts, shift_score=-np.mean(err[found])
+                        ref,
+                        new_points_array=shifted_pts[start:offset],
+                        shift_score=-errs[start:offset][inst_found].mean(),
                     )
                 )
 
@@ -267,6 +308,32 @@ class SimpleCandidateMaker:
                     candidate_instances.append(ref_instance)
         return candidate_instances
 
+    def get_candidates_by_track(
+        self, instances_by_track: Dict[Track, Deque[InstanceType]]
+    ) -> Dict[Track, Deque[InstanceType]]:
+        """Returns the matching candidates grouped by track.
+
+        Args:
+            instances_by_track: The instances in the matching queue grouped by track,
+                as maintained by `Tracker`.
+
+        Returns:
+            The candidate instances for each track that has any.
+        """
+        if self.min_points <= 0:
+            return instances_by_track
+
+        candidates_by_track = dict()
+        for track, ref_instances in instances_by_track.items():
+            candidates = [
+                ref_instance
+                for ref_instance in ref_instances
+                if ref_instance.n_visible_points >= self.min_points
+            ]
+            if candidates:
+                candidates_by_track[track] = candidates
+        return candidates_by_track
+
 
 tracker_policies = dict(
     simple=SimpleCandidateMaker,
@@ -352,6 +419,13 @@ class Tracker(BaseTracker):
 
     track_matching_queue: Deque[MatchedFrameInstances] = attr.ib()
 
+    # The track of each instance in the matching queue when it was added, so that it
+    # can be removed from the right group even if its track is changed later.
+    _queue_tracks: Deque[List[Track]] = attr.ib(init=False)
+
+    # The instances in the matching queue grouped by track, oldest first.
+    _queue_instances_by_track: Dict[Track, Deque[InstanceType]] = attr.ib(init=False)
+
     spawned_tracks: List[Track] = attr.ib(factory=list)
 
     save_tracked_instances: bool = False
@@ -370,19 +444,57 @@ class Tracker(BaseTracker):
         """Factory for instantiating default matching queue with specified size."""
         return deque(maxlen=self.track_window)
 
+    @_queue_tracks.default
+    def _init_queue_tracks(self):
+        return deque(
+            [instance.track for instance in match_item.instances_t]
+            for match_item in self.track_matching_queue
+        )
+
+    @_queue_instances_by_track.default
+    def _init_queue_instances_by_track(self):
+        queue_instances_by_track = dict()
+        for tracks, match_item in zip(self._queue_tracks, self.track_matching_queue):
+            for track, instance in zip(tracks, match_item.instances_t):
+                queue_instances_by_track.setdefault(track, deque()).append(instance)
+        return queue_instances_by_track
+
+    def _regroup_queue(self):
+        """Regroups the instances in the matching queue by their current tracks."""
+        self._queue_tracks = self._init_queue_tracks()
+        self._queue_instances_by_track = self._init_queue_instances_by_track()
+
     def reset_candidates(self):
         self.track_matching_queue = deque(maxlen=self.track_window)
+        self._queue_tracks = deque()
+        self._queue_instances_by_track = dict()
+
+    def _append_to_queue(self, match_item: MatchedFrameInstances):
+        """Adds a frame to the matching queue and updates the per-track instances.
+
+        If the queue is full, the instances of the oldest frame are also removed from
+        the per-track instances since the queue will drop that frame.
+        """
+        queue = self.track_matching_queue
+        if queue.maxlen is not None and len(queue) == queue.maxlen:
+            # The oldest frame's instances are at the front of the deques for the
+            # tracks they had when they were added.
+            for track in self._queue_tracks.popleft():
+                track_instances = self._queue_instances_by_track[track]
+                track_instances.popleft()
+                if not track_instances:
+                    del self._queue_instances_by_track[track]
+
+        queue.append(match_item)
+        tracks = [instance.track for instance in match_item.instances_t]
+        self._queue_tracks.append(tracks)
+        for track, instance in zip(tracks, match_item.instances_t):
+            self._queue_instances_by_track.setdefault(track, deque()).append(instance)
 
     @property
     def unique_tracks_in_queue(self) -> List[Track]:
         """Returns the unique tracks in the matching queue."""
-
-        unique_tracks = set()
-        for match_item in self.track_matching_queue:
-            for instance in match_item.instances_t:
-                unique_tracks.add(instance.track)
-
-        return list(unique_tracks)
+        return list(self._queue_instances_by_track)
 
     @property
     def uses_image(self):
@@ -418,6 +530,11 @@ class Tracker(BaseTracker):
             else:
                 t = 0
 
+        # Preprocess the image once here so that the preprocessed image is stored in
+        # the matching queue and can be reused while this frame is a reference.
+        if img is not None and hasattr(self.candidate_maker, "prepare_image"):
+            img = self.candidate_maker.prepare_image(img)
+
         # Initialize containers for tracked instances at the current timestep.
         tracked_instances = []
 
@@ -430,20 +547,38 @@ class Tracker(BaseTracker):
             if self.pre_cull_function:
                 self.pre_cull_function(untracked_instances)
 
-            # Build a pool of matchable candidate instances.
-            candidate_instances = self.candidate_maker.get_candidates(
-                track_matching_queue=self.track_matching_queue,
-                t=t,
-                img=img,
-            )
+            if hasattr(self.candidate_maker, "get_candidates_by_track"):
+                # Candidates are instances from the queue, so use the per-track
+                # instances we already keep instead of grouping them every frame.
+                candidate_instances_by_track = (
+                    self.candidate_maker.get_candidates_by_track(
+                        self._queue_instances_by_track
+                    )
+                )
 
-            # Determine matches for untracked instances in current frame.
-            frame_matches = FrameMatches.from_candidate_instances(
-                untracked_instances=untracked_instances,
-                candidate_instances=candidate_instances,
-                similarity_function=self.similarity_function,
-                matching_function=self.matching_function,
-            )
+                # Determine matches for untracked instances in current frame.
+                frame_matches = FrameMatches.from_candidate_instances_by_track(
+                    untracked_instances=untracked_instances,
+                    candidate_instances_by_track=candidate_instances_by_track,
+                    similarity_function=self.similarity_function,
+                    matching_function=self.matching_function,
+                )
+
+            else:
+                # Build a pool of matchable candidate instances.
+                candidate_instances = self.candidate_maker.get_candidates(
+                    track_matching_queue=self.track_matching_queue,
+                    t=t,
+                    img=img,
+                )
+
+                # Determine matches for untracked instances in current frame.
+                frame_matches = FrameMatches.from_candidate_instances(
+                    untracked_instances=untracked_instances,
+                    candidate_instances=candidate_instances,
+                    similarity_function=self.similarity_function,
+                    matching_function=self.matching_function,
+                )
 
             # Store the most recent match data (for outside inspection).
             self.last_matches = frame_matches
@@ -459,9 +594,7 @@ class Tracker(BaseTracker):
             )
 
         # Add the tracked instances to the matching buffer.
-        self.track_matching_queue.append(
-            MatchedFrameInstances(t, tracked_instances, img)
-        )
+        self._append_to_queue(MatchedFrameInstances(t, tracked_instances, img))
 
         # Save tracked instances internally.
         if self.save_tracked_instances:
@@ -469,16 +602,30 @@ class Tracker(BaseTracker):
 
         return tracked_instances
 
+    @staticmethod
+    def _copy_with_track(
+        instance: InstanceType, track: Track, tracking_score: Optional[float] = None
+    ) -> InstanceType:
+        """Returns a copy of an instance that is assigned to a track.
+
+        This is equivalent to `attr.evolve(instance, track=track, ...)` but copies the
+        attribute values directly instead of calling `__init__`, so that the
+        validation and point array setup of the existing instance aren't repeated.
+        """
+        new_instance = copy.copy(instance)
+        new_instance.track = track
+        if tracking_score is not None:
+            new_instance.tracking_score = float(tracking_score)
+        return new_instance
+
     @staticmethod
     def update_matched_instance_tracks(matches: List[Match]) -> List[InstanceType]:
         inst_list = []
         for match in matches:
             # Assign to track and save.
             inst_list.append(
-                attr.evolve(
-                    match.instance,
-                    track=match.track,
-                    tracking_score=match.score,
+                Tracker._copy_with_track(
+                    match.instance, track=match.track, tracking_score=match.score
                 )
             )
         return inst_list
@@ -498,7 +645,7 @@ class Tracker(BaseTracker):
             self.spawned_tracks.append(new_track)
 
             # Assign instance to the new track and save.
-            results.append(attr.evolve(inst, track=new_track))
+            results.append(self._copy_with_track(inst, track=new_track))
 
         return results
 
@@ -516,6 +663,10 @@ class Tracker(BaseTracker):
         elif self.target_instance_count and self.post_connect_single_breaks:
             connect_single_track_breaks(frames, self.target_instance_count)
 
+        # The post-processing may have changed the tracks of instances that are still
+        # in the matching queue, so regroup them in case tracking continues.
+        self._regroup_queue()
+
     def get_name(self):
         tracker_name = self.candidate_maker.__class__.__name__
         similarity_name = self.similarity_function.__name__
@@ -76,6 +76,47 @@ def compute_iou(bbox1: np.ndarray, bbox2: np.ndarray) -> float:
     return iou
 
 
+def compute_iou_matrix(bboxes1: np.ndarray, bboxes2: np.ndarray) -> np.ndarray:
+    """Computes the intersection over union for all pairs of bounding boxes.
+
+    This is a vectorized version of `compute_iou`.
+
+    Args:
+        bboxes1: Bounding boxes of shape (n1, 4) specified by corner coordinates
+            [y1, x1, y2, x2].
+        bboxes2: Bounding boxes of shape (n2, 4) specified by corner coordinates
+            [y1, x1, y2, x2].
+
+    Returns:
+        An array of shape (n1, n2) with the IOU between each pair of bounding boxes.
+    """
+
+    bboxes1 = bboxes1[:, None]
+    bboxes2 = bboxes2[None]
+
+    intersection_y1 = np.maximum(bboxes1[..., 0], bboxes2[..., 0])
+    intersection_x1 = np.maximum(bboxes1[..., 1], bboxes2[..., 1])
+    intersection_y2 = np.minimum(bboxes1[..., 2], bboxes2[..., 2])
+    intersection_x2 = np.minimum(bboxes1[..., 3], bboxes2[..., 3])
+
+    intersection_area = np.maximum(
+        intersection_x2 - intersection_x1 + 1, 0
+    ) * np.maximum(intersection_y2 - intersection_y1 + 1, 0)
+
+    bboxes1_area = (bboxes1[..., 3] - bboxes1[..., 1] + 1) * (
+        bboxes1[..., 2] - bboxes1[..., 0] + 1
+    )
+    bboxes2_area = (bboxes2[..., 3] - bboxes2[..., 1] + 1) * (
+        bboxes2[..., 2] - bboxes2[..., 0] + 1
+    )
+
+    union_area = bboxes1_area + bboxes2_area - intersection_area
+
+    iou = intersection_area / union_area
+
+    return iou
+
+
 @tf.function
 def tf_linear_sum_assignment(cost_matrix: tf.Tensor) -> tf.Tensor:
     """Run `linear_sum_assignment` as a TensorFlow function.
@@ -1,10 +1,20 @@
 import pytest
 import os
 import h5py
+import cv2
 
 import numpy as np
 
-from sleap.io.video import Video, HDF5Video, MediaVideo, DummyVideo, load_video
+from sleap.io.video import (
+    Video,
+    HDF5Video,
+    MediaVideo,
+    DummyVideo,
+    load_video,
+    cache_path_lookups,
+    _prefetch_map,
+    _threaded_map,
+)
 from tests.fixtures.videos import (
     TEST_H5_FILE,
     TEST_SMALL_ROBOT_MP4_FILE,
@@ -56,6 +66,16 @@ def test_hdf5_get_frames(hdf5_vid):
     assert hdf5_vid.get_frames([0, 1]).shape == (2, 512, 512, 1)
 
 
+def test_hdf5_rechunk_to_channels_last(hdf5_vid, tmpdir):
+    path = os.path.join(tmpdir, "rechunked.h5")
+    vid = hdf5_vid.backend.rechunk_to_channels_last(path, "box")
+
+    assert vid.shape == hdf5_vid.shape
+    assert vid.backend.input_format == "channels_last"
+    assert np.array_equal(vid.get_frames([0, 41]), hdf5_vid.get_frames([0, 41]))
+    vid.close()
+
+
 def test_hdf5_get_item(hdf5_vid):
     assert hdf5_vid[0].shape == (1, 512, 512, 1)
     assert np.alltrue(hdf5_vid[1:10:3] == hdf5_vid.get_frames([1, 4, 7]))
@@ -98,6 +118,33 @@ def test_mp4_get_item(small_robot_mp4_vid):
     )
 
 
+def test_mp4_pyav_reader(small_robot_mp4_vid):
+    pytest.importorskip("av")
+    vid = Video.from_media(TEST_SMALL_ROBOT_MP4_FILE, reader_backend="pyav")
+
+    assert vid.shape == small_robot_mp4_vid.shape
+    assert vid.get_frames([0, 1, 2, 10, 3]).shape == (5, 320, 560, 3)
+    assert np.allclose(vid.get_frame(10), small_robot_mp4_vid.get_frame(10), atol=10)
+
+
+def test_mp4_iter_frames(small_robot_mp4_vid):
+    frames = list(small_robot_mp4_vid.backend.iter_frames(5, 8))
+
+    assert len(frames) == 3
+    for idx, frame in zip(range(5, 8), frames):
+        assert np.array_equal(frame, small_robot_mp4_vid.get_frame(idx))
+
+
+@pytest.mark.parametrize("idxs", [[5, 6, 7], [20, 3, 11]])
+def test_get_frames_gpu(small_robot_mp4_vid, idxs):
+    frames = small_robot_mp4_vid.get_frames_gpu(idxs, device_name="/device:CPU:0")
+
+    assert frames.device.endswith("CPU:0")
+    assert tuple(frames.shape) == (len(idxs), 320, 560, 3)
+    assert frames.dtype.as_numpy_dtype == np.uint8
+    assert np.array_equal(frames.numpy(), small_robot_mp4_vid.get_frames(idxs))
+
+
 def test_mp4_file_not_found():
     with pytest.raises(FileNotFoundError):
         vid = Video.from_media("non-existent-filename.mp4")
@@ -205,6 +252,34 @@ def test_imgstore_indexing(small_robot_mp4_vid, tmpdir):
         imgstore_vid.get_frames([0, 1, 2])
 
 
+def test_imgstore_from_generator(small_robot_mp4_vid, tmpdir):
+    path = os.path.join(tmpdir, "test_imgstore")
+    vid = small_robot_mp4_vid.to_imgstore(path, frame_numbers=(i for i in [20, 40, 15]))
+
+    assert vid.num_frames == 3
+    assert vid.get_frames([20, 40, 15]).shape == (3, 320, 560, 3)
+
+
+def test_imgstore_frame_order(small_robot_mp4_vid, tmpdir):
+    frame_indices = [20, 3, 40, 15, 16, 2]
+
+    # Media source, with frames read out of order.
+    media_path = os.path.join(tmpdir, "from_media")
+    vid = small_robot_mp4_vid.to_imgstore(
+        media_path, frame_numbers=frame_indices, n_workers=4
+    )
+    for idx in frame_indices:
+        np.testing.assert_array_equal(
+            vid.get_frame(idx), small_robot_mp4_vid.get_frame(idx)
+        )
+
+    # ImgStore source, which must not be read from multiple threads.
+    imgstore_path = os.path.join(tmpdir, "from_imgstore")
+    vid2 = vid.to_imgstore(imgstore_path, frame_numbers=frame_indices, n_workers=4)
+    for idx in frame_indices:
+        np.testing.assert_array_equal(vid2.get_frame(idx), vid.get_frame(idx))
+
+
 def test_imgstore_deferred_loading(small_robot_mp4_vid, tmpdir):
     path = os.path.join(tmpdir, "test_imgstore")
     frame_indices = [20, 40, 15]
@@ -233,6 +308,20 @@ def test_imgstore_no_frames(small_robot_mp4_vid, tmpdir):
     assert vid.dtype == np.dtype("uint8")
 
 
+def test_hdf5_convert_range_clips(tmpdir):
+    path = os.path.join(tmpdir, "float_frames.h5")
+    data = np.array([-0.5, 0.0, 0.5, 1.0], dtype="float32").reshape(1, 2, 2, 1)
+    with h5py.File(path, "w") as f:
+        f.create_dataset("frames", data=data)
+
+    vid = Video.from_hdf5(dataset="frames", filename=path, convert_range=True)
+    frame = vid.get_frame(0)
+
+    assert frame.dtype == np.uint8
+    np.testing.assert_array_equal(frame.ravel(), [0, 0, 127, 255])
+    vid.close()
+
+
 def test_empty_hdf5_video(small_robot_mp4_vid, tmpdir):
     path = os.path.join(tmpdir, "test_to_hdf5")
     hdf5_vid = small_robot_mp4_vid.to_hdf5(path, "testvid", frame_numbers=[])
@@ -268,6 +357,52 @@ def test_hdf5_inline_video(small_robot_mp4_vid, tmpdir, format):
         )
 
 
+def test_hdf5_inline_video_encode_params(small_robot_mp4_vid, tmpdir):
+    path = os.path.join(tmpdir, "test_to_hdf5_jpg_quality")
+    hdf5_vid = small_robot_mp4_vid.to_hdf5(
+        path,
+        "testvid",
+        format="jpg",
+        frame_numbers=[0, 1],
+        encode_params=[cv2.IMWRITE_JPEG_QUALITY, 50],
+    )
+    assert hdf5_vid.get_frame(1).shape == (320, 560, 3)
+    hdf5_vid.close()
+
+
+def test_hdf5_multi_frame_chunks(tmpdir, monkeypatch):
+    import sleap.io.video
+
+    # Three 8x8 frames per chunk, with a partial chunk at the end.
+    monkeypatch.setattr(sleap.io.video, "HDF5_CHUNK_BYTES", 3 * 8 * 8)
+    data = np.arange(10 * 8 * 8, dtype=np.uint8).reshape(10, 8, 8, 1)
+    path = os.path.join(tmpdir, "test_chunks.h5")
+
+    hdf5_vid = Video.from_numpy(data).to_hdf5(path, "testvid")
+
+    with h5py.File(path, "r") as f:
+        assert f["testvid/video"].chunks == (3, 8, 8, 1)
+        assert f["testvid/frame_numbers"].dtype == np.int32
+        assert f["testvid/frame_numbers"].compression == "lzf"
+    assert np.array_equal(hdf5_vid.get_frames(range(10)), data)
+    hdf5_vid.close()
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+@pytest.mark.parametrize("dtype", ["uint8", "uint16"])
+def test_hdf5_direct_chunk_write(tmpdir, monkeypatch, compression, dtype):
+    import sleap.io.video
+
+    monkeypatch.setattr(sleap.io.video, "HDF5_CHUNK_BYTES", 4 * 8 * 8)
+    data = np.arange(10 * 8 * 8).reshape(10, 8, 8, 1).astype(dtype)
+    path = os.path.join(tmpdir, "test_direct.h5")
+
+    hdf5_vid = Video.from_numpy(data).to_hdf5(path, "testvid", compression=compression)
+
+    assert np.array_equal(hdf5_vid.get_frames(range(10)), data)
+    hdf5_vid.close()
+
+
 def test_hdf5_indexing(small_robot_mp4_vid, tmpdir):
     """
     Test different types of indexing (by frame number or index).
@@ -319,6 +454,26 @@ def test_hdf5_indexing(small_robot_mp4_vid, tmpdir):
         hdf5_vid2.get_frames([0, 1, 2])
 
 
+def test_hdf5_shared_file_handle():
+    vid1 = Video.from_hdf5(
+        filename=TEST_H5_FILE, dataset=TEST_H5_DSET, input_format=TEST_H5_INPUT_FORMAT
+    )
+    vid2 = Video.from_hdf5(
+        filename=os.path.abspath(TEST_H5_FILE),
+        dataset=TEST_H5_DSET,
+        input_format=TEST_H5_INPUT_FORMAT,
+    )
+    assert vid1.backend.matches(vid2.backend)
+
+    vid1.get_frame(0)
+    vid2.get_frame(0)
+
+    # Closing one video should leave the shared file open for the other.
+    vid1.close()
+    assert vid2.get_frame(1).shape == (512, 512, 1)
+    vid2.close()
+
+
 def test_hdf5_vid_from_open_dataset():
     with h5py.File(TEST_H5_FILE, "r") as f:
         dataset = f[TEST_H5_DSET]
@@ -392,6 +547,25 @@ def test_numpy_video_backend():
     assert vid.get_frame(1).shape == (3, 4, 1)
 
 
+def test_numpy_video_matches(tmpdir):
+    data = np.random.randint(0, 255, size=(4, 2, 3, 1), dtype="uint8")
+    vid = Video.from_numpy(data)
+
+    assert vid.backend.matches(Video.from_numpy(data).backend)
+    assert vid.backend.matches(Video.from_numpy(data.copy()).backend)
+
+    other_data = data.copy()
+    other_data[1] += 1
+    assert not vid.backend.matches(Video.from_numpy(other_data).backend)
+    assert not vid.backend.matches(Video.from_numpy(data[:3]).backend)
+
+    path = os.path.join(tmpdir, "video.npy")
+    np.save(path, data)
+    file_vid = Video.from_numpy(path)
+    assert file_vid.backend.matches(Video.from_numpy(path).backend)
+    assert file_vid.backend.matches(vid.backend)
+
+
 def test_safe_frame_loading_all_invalid():
     vid = Video.from_filename("video_that_does_not_exist.mp4")
 
@@ -405,3 +579,63 @@ def test_load_video():
     video = load_video(TEST_SMALL_CENTERED_PAIR_VID)
     assert video.shape == (1100, 384, 384, 1)
     assert video[:3].shape == (3, 384, 384, 1)
+
+
+def test_prefetch_map():
+    assert list(_prefetch_map(lambda x: x * 2, range(20), prefetch=2)) == list(
+        range(0, 40, 2)
+    )
+
+    def fail_on_3(x):
+        if x == 3:
+            raise KeyError(x)
+        return x
+
+    with pytest.raises(KeyError):
+        list(_prefetch_map(fail_on_3, range(10)))
+
+
+def test_fixup_path_search_dirs(tmpdir):
+    path = os.path.join(str(tmpdir), "found.mp4")
+    open(path, "w").close()
+
+    assert Video.fixup_path("/missing/dir/found.mp4") == "/missing/dir/found.mp4"
+    assert (
+        Video.fixup_path("/missing/dir/found.mp4", search_dirs=[str(tmpdir)]) == path
+    )
+
+    with pytest.raises(FileNotFoundError):
+        Video.fixup_path("/missing/dir/other.mp4", raise_error=True)
+
+
+def test_fixup_path_cache(tmpdir):
+    path = os.path.join(str(tmpdir), "cached.mp4")
+    open(path, "w").close()
+
+    with cache_path_lookups():
+        assert Video.fixup_path(path) == path
+
+        # Found paths are cached while loading.
+        os.remove(path)
+        assert Video.fixup_path(path, search_dirs=[]) == path
+
+    # The cache is discarded afterwards, so the deleted file is not found.
+    with pytest.raises(FileNotFoundError):
+        Video.fixup_path(path, raise_error=True, search_dirs=[])
+
+
+def test_threaded_map():
+    assert list(_threaded_map(lambda x: x * 2, range(50), n_workers=3)) == list(
+        range(0, 100, 2)
+    )
+
+    # Only a bounded number of items are submitted ahead of the consumer.
+    started = []
+
+    def record(x):
+        started.append(x)
+        return x
+
+    for i, x in enumerate(_threaded_map(record, range(50), n_workers=2, max_pending=3)):
+        assert x == i
+        assert len(started) <= i + 1 + 3
@@ -0,0 +1,53 @@
+import os
+
+from sleap.nn.system import use_cpu_only
+
+use_cpu_only()  # hide GPUs for test
+
+from sleap.nn.config.training_job import TrainingJobConfig, strip_json_comments
+from sleap.util import json_loads
+
+
+def test_strip_json_comments():
+    json_data = """{
+        // Line comment.
+        "a": 1, /* Block comment. */
+        /* Multi-line
+           block comment. */
+        "b": "http://example.com/path", // Comment after a string.
+        "c": "/* not a comment */",
+        "d": "escaped \\" // quote"
+    }"""
+
+    assert json_loads(strip_json_comments(json_data)) == {
+        "a": 1,
+        "b": "http://example.com/path",
+        "c": "/* not a comment */",
+        "d": 'escaped " // quote',
+    }
+
+
+def test_load_json_cache(tmpdir):
+    filename = os.path.join(tmpdir, "training_config.json")
+    cfg = TrainingJobConfig(name="first")
+    cfg.optimization.batch_size = 2
+    cfg.save_json(filename)
+
+    # Modifying a loaded config does not affect later loads.
+    cfg1 = TrainingJobConfig.load_json(filename)
+    cfg1.name = "modified"
+    cfg1.optimization.batch_size = 16
+
+    cfg2 = TrainingJobConfig.load_json(filename)
+    assert cfg2 is not cfg1
+    assert cfg2.name == "first"
+    assert cfg2.optimization.batch_size == 2
+    assert cfg2.filename == filename
+
+    # An edited file is read again.
+    cfg.name = "edited"
+    cfg.save_json(filename)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert TrainingJobConfig.load_json(filename).name == "edited"
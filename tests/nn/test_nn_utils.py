@@ -2,7 +2,12 @@ import sleap
 import tensorflow as tf
 import numpy as np
 from numpy.testing import assert_array_equal, assert_allclose
-from sleap.nn.utils import tf_linear_sum_assignment, match_points
+from sleap.nn.utils import (
+    tf_linear_sum_assignment,
+    match_points,
+    compute_iou,
+    compute_iou_matrix,
+)
 
 sleap.use_cpu_only()
 
@@ -20,3 +25,15 @@ def test_match_points():
 
     assert_array_equal(inds1, [0, 1])
     assert_array_equal(inds2, [1, 0])
+
+
+def test_compute_iou_matrix():
+    bboxes1 = np.array([[0, 0, 9, 9], [5, 5, 14, 14]], dtype="float32")
+    bboxes2 = np.array([[0, 0, 9, 9], [20, 20, 30, 30], [0, 5, 9, 14]], "float32")
+
+    iou = compute_iou_matrix(bboxes1, bboxes2)
+
+    assert iou.shape == (2, 3)
+    for i, bbox1 in enumerate(bboxes1):
+        for j, bbox2 in enumerate(bboxes2):
+            assert_allclose(iou[i, j], compute_iou(bbox1, bbox2))
@@ -8,9 +8,15 @@ from sleap.nn.tracker.components import (
     cull_instances,
     FrameMatches,
     greedy_matching,
+    hungarian_matching,
+    instance_similarity,
+    instance_similarity_batch,
+    centroid_distance,
+    instance_iou,
+    best_track_similarities_batch,
 )
 
-from sleap.instance import PredictedInstance
+from sleap.instance import PredictedInstance, Track
 from sleap.skeleton import Skeleton
 
 
@@ -166,3 +172,188 @@ def test_frame_match_object():
 
     assert matches[1].track == "track b"
     assert matches[1].instance == "instance b"
+
+
+@pytest.mark.parametrize(
+    "similarity_function", [instance_similarity, centroid_distance, instance_iou]
+)
+def test_best_track_similarities_batch(similarity_function):
+    skeleton = Skeleton()
+    skeleton.add_nodes(("a", "b", "c"))
+
+    def make_instance(points, track=None):
+        return PredictedInstance.from_arrays(
+            points=np.array(points, dtype="float64"),
+            point_confidences=np.ones(3),
+            instance_score=1.0,
+            skeleton=skeleton,
+            track=track,
+        )
+
+    track_a, track_b = Track(name="a"), Track(name="b")
+    untracked = [
+        make_instance([[0, 0], [1, 1], [np.nan, np.nan]]),
+        make_instance([[5, 5], [6, 6], [7, 7]]),
+    ]
+    candidates_by_track = {
+        track_a: [
+            make_instance([[0, 0.5], [1, 1], [2, 2]], track_a),
+            make_instance([[5, 5], [6, 6.5], [np.nan, np.nan]], track_a),
+        ],
+        track_b: [make_instance([[5, 5.2], [6, 6], [7, 7]], track_b)],
+    }
+    tracks = [track_a, track_b]
+
+    similarities = best_track_similarities_batch(
+        untracked, tracks, candidates_by_track, similarity_function
+    )
+
+    expected = [
+        [
+            max(similarity_function(inst, cand) for cand in candidates_by_track[track])
+            for track in tracks
+        ]
+        for inst in untracked
+    ]
+    np.testing.assert_allclose(similarities, expected)
+
+
+def test_greedy_matching():
+    cost_matrix = np.array(
+        [
+            [1, 2, 9],
+            [0.5, 5, 6],
+            [3, 4, 8],
+        ]
+    )
+
+    assert greedy_matching(cost_matrix) == [(1, 0), (0, 1), (2, 2)]
+
+    # Non-square cost matrix leaves a row unassigned.
+    assert greedy_matching(cost_matrix[:, :2]) == [(1, 0), (0, 1)]
+
+
+def test_hungarian_matching():
+    cost_matrix = np.array(
+        [
+            [1, 2, 9],
+            [0.5, 5, 6],
+        ]
+    )
+
+    assert sorted(hungarian_matching(cost_matrix)) == [(0, 1), (1, 0)]
+
+
+def test_copy_with_track():
+    skeleton = Skeleton()
+    skeleton.add_nodes(("a", "b"))
+    inst = PredictedInstance.from_arrays(
+        points=np.array([[1, 2], [3, 4]], dtype="float64"),
+        point_confidences=np.ones(2),
+        instance_score=0.5,
+        skeleton=skeleton,
+    )
+    track = Track(name="a")
+
+    new_inst = Tracker._copy_with_track(inst, track=track, tracking_score=0.25)
+
+    assert new_inst is not inst
+    assert inst.track is None
+    assert new_inst.track is track
+    assert new_inst.tracking_score == 0.25
+    assert new_inst.score == 0.5
+    np.testing.assert_array_equal(new_inst.points_array, inst.points_array)
+
+
+def test_queue_instances_by_track():
+    skeleton = Skeleton()
+    skeleton.add_nodes(("a", "b"))
+
+    def make_instance(x):
+        return PredictedInstance.from_arrays(
+            points=np.array([[x, 0], [x, 1]], dtype="float64"),
+            point_confidences=np.ones(2),
+            instance_score=1.0,
+            skeleton=skeleton,
+        )
+
+    def assert_grouped_by_current_track(t):
+        expected = dict()
+        for match_item in t.track_matching_queue:
+            for instance in match_item.instances_t:
+                expected.setdefault(instance.track, []).append(instance)
+        assert {
+            track: list(instances)
+            for track, instances in t._queue_instances_by_track.items()
+        } == expected
+        assert set(t.unique_tracks_in_queue) == set(expected)
+
+    t = Tracker.make_tracker_by_name("simple", "centroid", "greedy", track_window=2)
+    for frame_idx in range(4):
+        # A third instance appears only in the first frame.
+        xs = [0, 50, 100] if frame_idx == 0 else [0, 50]
+        t.track([make_instance(x + frame_idx) for x in xs], t=frame_idx)
+        assert_grouped_by_current_track(t)
+
+    assert len(t.spawned_tracks) == 3
+    assert len(t._queue_instances_by_track) == 2
+
+    # Change the tracks of queued instances (e.g., as post-processing does) and keep
+    # tracking until they have left the queue.
+    queued_instances = t.track_matching_queue[-1].instances_t
+    queued_instances[0].track = None
+    queued_instances[1].track = t.spawned_tracks[2]
+    for frame_idx in range(4, 7):
+        t.track([make_instance(x + frame_idx) for x in [0, 50]], t=frame_idx)
+    assert_grouped_by_current_track(t)
+
+    # Regroup by the changed tracks after the final pass.
+    queued_instances = t.track_matching_queue[-1].instances_t
+    queued_instances[0].track = None
+    t.final_pass([])
+    assert_grouped_by_current_track(t)
+    t.track([make_instance(x + 7) for x in [0, 50]], t=7)
+    assert_grouped_by_current_track(t)
+
+
+def test_instance_similarity_batch():
+    skeleton = Skeleton()
+    skeleton.add_nodes(("a", "b", "c"))
+    points = np.array(
+        [
+            [[0, 0], [1, 1], [np.nan, np.nan]],
+            [[0, 0.5], [1, 1], [2, 2]],
+            [[5, 5], [np.nan, np.nan], [7, 7]],
+        ]
+    )
+    instances = [
+        PredictedInstance.from_arrays(
+            points=pts,
+            point_confidences=np.ones(3),
+            instance_score=1.0,
+            skeleton=skeleton,
+        )
+        for pts in points
+    ]
+
+    similarities = instance_similarity_batch(points, points)
+
+    expected = [[instance_similarity(a, b) for b in instances] for a in instances]
+    np.testing.assert_allclose(similarities, expected)
+
+
+def test_instance_similarity_mismatched_nodes():
+    def make_instance(n_nodes):
+        skeleton = Skeleton()
+        skeleton.add_nodes([f"n{i}" for i in range(n_nodes)])
+        return PredictedInstance.from_arrays(
+            points=np.arange(n_nodes * 2, dtype="float64").reshape(n_nodes, 2),
+            point_confidences=np.ones(n_nodes),
+            instance_score=1.0,
+            skeleton=skeleton,
+        )
+
+    with pytest.raises(ValueError):
+        instance_similarity(make_instance(3), make_instance(2))
+    with pytest.raises(ValueError):
+        instance_similarity(make_instance(2), make_instance(3))
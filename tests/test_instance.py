@@ -190,6 +190,22 @@ def test_points_array(skeleton):
     assert np.isnan(pts[skeleton.node_to_index("thorax"), :]).all()
 
 
+def test_n_visible_points(skeleton):
+    points = {"head": Point(1, 4), "left-wing": Point(2, 5), "right-wing": Point(3, 6)}
+    instance = Instance(skeleton=skeleton, points=points)
+    assert instance.n_visible_points == 3
+    assert len(instance) == 3
+
+    # Invisible and NaN points are not counted, and edits are reflected.
+    instance["head"] = Point(1, 4, visible=False)
+    instance["right-wing"] = Point(np.nan, np.nan)
+    assert instance.n_visible_points == 1
+    assert instance.n_visible_points == (~np.isnan(instance.points_array[:, 0])).sum()
+
+    instance["thorax"] = Point(1, 2)
+    assert instance.n_visible_points == 2
+
+
 def test_points_array_copying(skeleton):
     node_names = ["left-wing", "head", "right-wing"]
     points = {"head": Point(1, 4), "left-wing": Point(2, 5), "right-wing": Point(3, 6)}